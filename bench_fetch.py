@@ -0,0 +1,228 @@
+"""Benchmark de la capa de fetch contra los mocks locales (mock_upstreams.py).
+
+Levanta los mocks en un puerto libre, apunta a ellos los generadores reales
+(URLs y pools de mvshub-epg-generator.py, TVTV_API_URL de generate_epg.py) y
+mide cada escenario con varios niveles de concurrencia:
+
+    mvshub   init (/customer, /account, /token) + un epgcache por canal + XML
+    tvtv     un grid por dia (--dias) + XML
+
+Por corrida se guarda tiempo total, requests vistos por el mock (por status),
+req/s, MB/s, canales/dias fallidos y p50/p95 de cada fetch. El resultado es un
+JSON que sirve de baseline; con --compare se compara contra uno anterior y el
+exit code es 1 si alguna corrida es mas lenta que la tolerancia.
+
+main() de mvshub necesita Selenium (Chrome) para sacar cookies y JWT, asi que
+la corrida hace el login contra el mock con el JWT de fallback y despues llama
+a fetch_epgs, lo mismo que main(): ventana de fetch, prioridades, deadline,
+bounded_pipeline y build_xml_epgs escribiendo en un directorio temporal. Lo
+que se mide es el cliente (pools, AIMD, retries, parseo, XML), no el login.
+
+Uso:
+    python bench_fetch.py --concurrency 1,2,4,8 --errors 406:0.05,503:0.02 -o bench/baseline.json
+    python bench_fetch.py --compare bench/baseline.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from requests.adapters import HTTPAdapter
+
+from epg_daemon import load_script
+from mock_upstreams import MVS_PREFIX, MockConfig, parse_errors, start_mock
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('mvshub', 'tvtv')
+
+
+def percentile(values, q):
+    """Percentil q (0-100) por rango mas cercano; None si no hay valores."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def load_mvshub(base_url):
+    """mvshub-epg-generator.py con todas sus URLs y pools apuntando al mock."""
+    mod = load_script('mvshub_bench', 'mvshub-epg-generator.py')
+    api = base_url + MVS_PREFIX
+    mod.TOKEN_URL = api + '/login/cache/token'
+    mod.CUSTOMER_URL = api + '/v1/customer'
+    mod.ACCOUNT_URL = api + '/v1/account'
+    mod.EPG_BASE_URL = api + '/epgcache/list'
+    mod.HTTP_STATE = None  # Cada corrida arranca con el limite AIMD minimo, sin leer ni pisar http_state.json
+    return mod
+
+
+def load_tvtv(base_url):
+    """generate_epg.py con TVTV_API_URL apuntando al mock."""
+    gen = load_script('generate_epg_bench', 'generate_epg.py')
+    gen.tvtv_api = base_url + '/api/v1'
+    return gen
+
+
+def run_mvshub(mod, base_url, concurrency, channels, out_dir):
+    """Una corrida: init + UUID + fetch_epgs (el mismo fetch + XML de main()). Retorna metricas parciales."""
+    mod.HOST_POOLS = {base_url: concurrency}
+    mod.RUN_BUDGET = mod.RunBudget(None)
+    jwt = mod.FALLBACK_JWT_FULL
+    output = os.path.join(out_dir, mod.OUTPUT_FILE)
+    latencies = []
+    fetch_channel_epg = mod.fetch_channel_epg
+
+    def timed_fetch(*args, **kwargs):
+        result, ms = _timed(fetch_channel_epg, *args, **kwargs)
+        latencies.append(ms)
+        return result
+
+    mod.fetch_channel_epg = timed_fetch  # fetch_epgs lo busca en el modulo en cada canal
+    try:
+        t0 = time.perf_counter()
+        session = mod.new_session({})
+        ok, account_id, region_id = mod.initialize_session(jwt, session, mod.API_HEADERS)
+        uuid_val, session = mod.fetch_uuid(jwt, {}, mod.API_HEADERS, account_id=account_id, region_id=region_id,
+                                           session=session)
+        auth = mod.decode_jwt(jwt, account_id=account_id, region_id=region_id)
+        target = mod.Lineup(mod.LINEUP_ID, region_id, list(channels), output)
+        empty = mod.fetch_epgs(session, uuid_val, auth, jwt, [target], {output: None})
+        wall = time.perf_counter() - t0
+    finally:
+        mod.fetch_channel_epg = fetch_channel_epg
+    guide = None if empty else mod.load_guide(output)
+    failed = len(channels) if guide is None else sum(1 for c in channels if not guide.rows_for(f"MVS.{c}"))
+    return {'wall_s': wall, 'units': len(channels), 'failed': failed, 'latencies_ms': latencies,
+            'programmes': len(guide) if guide is not None else 0, 'init_ok': ok}
+
+
+def run_tvtv(gen, concurrency, days):
+    """Una corrida: un grid por dia (como varias corridas de generate_epg) + XML de cada uno."""
+    start = datetime.utcnow().date()
+    urls = [gen.grid_url(f"{d}T05:00:00.000Z", f"{d + timedelta(days=1)}T04:59:00.000Z")
+            for d in (start + timedelta(days=i) for i in range(days))]
+    t0 = time.perf_counter()
+    scraper = gen.cloudscraper.create_scraper()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    scraper.mount('http://', adapter)
+    scraper.mount('https://', adapter)
+    with redirect_stdout(io.StringIO()):  # fetch_grid y write_xmltv imprimen por cada grid
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            fetched = list(pool.map(lambda url: _timed(gen.fetch_grid, scraper, url), urls))
+        programmes = sum(gen.write_xmltv(data, io.BytesIO()) for data, _ in fetched if data is not None)
+    scraper.close()
+    return {'wall_s': time.perf_counter() - t0, 'units': days,
+            'failed': sum(1 for data, _ in fetched if data is None),
+            'latencies_ms': [ms for _, ms in fetched], 'programmes': programmes}
+
+
+def measure(scenario, run, server, stats, concurrency):
+    """Corre run() con los contadores del mock en cero y arma la fila del baseline."""
+    handler = server.RequestHandlerClass
+    handler.rng.seed(handler.config.seed)  # Misma secuencia de latencias/errores en cada corrida
+    stats.reset()
+    result = run()
+    seen = stats.snapshot()
+    wall = result.pop('wall_s')
+    latencies = result.pop('latencies_ms')
+    row = {'scenario': scenario, 'concurrency': concurrency, 'wall_s': round(wall, 4),
+           'requests': seen['total_requests'], 'statuses': seen['statuses'],
+           'req_per_s': round(seen['total_requests'] / wall, 2) if wall else None,
+           'mb_per_s': round(seen['bytes_sent'] / wall / 1e6, 3) if wall else None,
+           'fetch_p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+           'fetch_p95_ms': round(percentile(latencies, 95), 1) if latencies else None}
+    row.update(result)
+    logger.warning(f"{scenario:<7} c={concurrency:<3} {row['wall_s']:8.3f}s  {row['requests']:5d} req  "
+                   f"{row['req_per_s']:8.1f} req/s  {row['mb_per_s']:7.3f} MB/s  failed={row['failed']}  "
+                   f"p50={row['fetch_p50_ms']}ms p95={row['fetch_p95_ms']}ms")
+    return row
+
+
+def compare(results, baseline, tolerance):
+    """Filas (scenario, concurrency) mas lentas que baseline * (1 + tolerance)."""
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline.get('results', [])}
+    regressions = []
+    for row in results:
+        old = previous.get((row['scenario'], row['concurrency']))
+        if not old or not old.get('wall_s'):
+            continue
+        ratio = row['wall_s'] / old['wall_s']
+        logger.warning(f"{row['scenario']:<7} c={row['concurrency']:<3} {old['wall_s']:.3f}s -> "
+                       f"{row['wall_s']:.3f}s ({ratio:.2f}x)")
+        if ratio > 1 + tolerance:
+            regressions.append(row)
+    return regressions
+
+
+def run_benchmark(config, scenarios=SCENARIOS, concurrency=(1, 2, 4, 8), channels=32, days=7):
+    """Barrido completo; retorna el dict que se guarda como baseline."""
+    server, base_url, stats = start_mock(config)
+    logger.warning(f"Mock upstreams on {base_url}")
+    out_dir = tempfile.TemporaryDirectory(prefix='bench_fetch_')
+    try:
+        channel_ids = list(range(1000, 1000 + channels))
+        mod = load_mvshub(base_url) if 'mvshub' in scenarios else None
+        gen = load_tvtv(base_url) if 'tvtv' in scenarios else None
+        logging.getLogger().setLevel(logging.WARNING)  # Los generadores loguean cada request en INFO
+        results = []
+        for level in concurrency:
+            if mod:
+                results.append(measure('mvshub', lambda: run_mvshub(mod, base_url, level, channel_ids, out_dir.name),
+                                       server, stats, level))
+            if gen:
+                results.append(measure('tvtv', lambda: run_tvtv(gen, level, days), server, stats, level))
+    finally:
+        server.shutdown()
+        out_dir.cleanup()
+    return {'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'), 'python': platform.python_version(),
+            'mock': config.as_dict(), 'channels': channels, 'days': days, 'results': results}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark de fetch contra mocks locales de tvtv y mvshub.")
+    parser.add_argument('--concurrency', default='1,2,4,8', help="Niveles separados por coma")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--canales', type=int, default=32, help="Canales mvshub por corrida")
+    parser.add_argument('--dias', type=int, default=7, help="Grids tvtv por corrida")
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--errors', default='', help="Probabilidad por status, p.ej. 406:0.05,429:0.02,503:0.01")
+    parser.add_argument('--programmes', type=int, default=48)
+    parser.add_argument('--desc-chars', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('-o', '--output', default=None, help="JSON de resultados (p.ej. bench/baseline.json)")
+    parser.add_argument('--compare', default=None, help="Baseline JSON contra el que comparar")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Regresion permitida en wall_s (0.25 = +25%%)")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.jitter_ms, parse_errors(args.errors), args.programmes,
+                        args.desc_chars, args.seed)
+    report = run_benchmark(config, [s.strip() for s in args.scenarios.split(',') if s.strip()],
+                           [int(c) for c in args.concurrency.split(',')], args.canales, args.dias)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        logger.warning(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report['results'], json.load(f), args.tolerance)
+        if regressions:
+            logger.error(f"{len(regressions)} runs slower than baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
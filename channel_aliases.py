@@ -0,0 +1,231 @@
+"""Registro de alias de canal entre fuentes: un solo indice hash precompilado.
+
+El mismo canal aparece como I108.18101.schedulesdirect.org en guia_filtrada.xml,
+Bandamax.mx en guiamix.xml, MVS.<id> en epgmvs.xml y un numero de tvtv en
+mlb.xml. compile_aliases() lee los <channel> de todas las guias (en orden de
+prioridad), normaliza IDs y display-names y une en un canal canonico los que
+comparten nombre entre fuentes distintas; nunca junta dos canales de una misma
+fuente. Un JSON manual de overrides fuerza uniones que los nombres no ven:
+
+    {"ADN 40": ["MVS.967", "I123.45678.schedulesdirect.org", "adn noticias"]}
+
+El resultado (channel_aliases.json) es un dict clave -> canal canonico:
+
+    id:<id exacto>           cualquier ID de cualquier fuente
+    name:<nombre normalizado> sin acentos/mayusculas/puntuacion, sin sufijo .mx/.co ni HD
+    num:<fuente>:<numero>    display-names numericos (LCN), solo dentro de su fuente
+
+asi resolve() es O(1) y merge/dedupe no necesitan comparar nombres en corrida.
+enrich.py lo usa (si existe) para completar cada canal solo desde su mismo canal
+en las guias ricas. Un override cuyo nombre canonico ya es el ID de otro canal
+se rechaza al compilar.
+
+Uso:
+    python channel_aliases.py compile guia_filtrada.xml guiamix.xml epgmvs.xml mlb.xml [--overrides manual.json]
+    python channel_aliases.py resolve Bandamax.mx MVS.967 "adn noticias"
+"""
+import argparse
+import html
+import json
+import logging
+import mmap
+import os
+import re
+
+from epg_output import write_if_changed
+from procesar_xml import delimitar_tv, escanear_elementos, normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+ALIASES_FILE = os.environ.get('CHANNEL_ALIASES_FILE', 'channel_aliases.json')
+DEFAULT_SOURCES = ['guia_filtrada.xml', 'guiamix.xml', 'epgmvs.xml', 'mlb.xml']
+VERSION = 1
+
+_RE_ID = re.compile(rb'\sid=(["\'])(.*?)\1', re.DOTALL)
+_RE_DISPLAY_NAME = re.compile(rb'<display-name\b[^>]*>(.*?)</display-name>', re.DOTALL)
+_RE_PAIS = re.compile(r'\.[a-z]{2}$')  # Sufijo de pais de open-epg: Cartoonito.mx
+_RE_CALIDAD = re.compile(r'(?:\s|^)(?:hd|sd|fhd|uhd|4k)$')
+_RE_NO_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def alias_key(name):
+    """Nombre normalizado para el indice: 'Bandamax.mx' y 'BANDAMAX HD' -> 'bandamax'."""
+    key = _RE_PAIS.sub('', normalizar_texto(name).strip())
+    key = _RE_CALIDAD.sub('', key.strip())
+    return _RE_NO_ALNUM.sub('', key)
+
+
+def source_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_channels(path):
+    """[(id, [display-names])] de los <channel> de un XMLTV, sin parsear los programas."""
+    channels = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        inicio, fin = delimitar_tv(buf)
+        for tag, a, b, _ in escanear_elementos(buf, inicio, fin):
+            if tag != b'channel':
+                continue
+            element = buf[a:b]
+            m = _RE_ID.search(element, 0, element.index(b'>') + 1)
+            if not m:
+                continue
+            names = [html.unescape(n.decode('utf-8')).strip() for n in _RE_DISPLAY_NAME.findall(element)]
+            channels.append((html.unescape(m.group(2).decode('utf-8')), [n for n in names if n]))
+    return channels
+
+
+class AliasIndex:
+    """Canales canonicos + dict clave -> indice del canal; resolve() es un par de lookups."""
+
+    def __init__(self, channels=None, keys=None):
+        self.channels = channels or []  # [{'id', 'name', 'members': {fuente: [ids]}}]
+        self.keys = keys or {}
+
+    def resolve(self, value, source=None):
+        """ID canonico de value (ID, display-name o numero de source), o None."""
+        idx = self.keys.get('id:' + value)
+        if idx is None and source and value.strip().isdigit():
+            idx = self.keys.get(f"num:{source}:{value.strip()}")
+        if idx is None:
+            key = alias_key(value)
+            idx = self.keys.get('name:' + key) if key else None
+        return None if idx is None else self.channels[idx]['id']
+
+    def channel(self, canonical_id):
+        idx = self.keys.get('id:' + canonical_id)
+        return None if idx is None else self.channels[idx]
+
+    def canonical_map(self, channel_ids, source=None):
+        """{id de una guia: id canonico} para los que el indice conoce (merge/dedupe de guias)."""
+        resolved = {}
+        for cid in channel_ids:
+            canonical = self.resolve(cid, source)
+            if canonical is not None:
+                resolved[cid] = canonical
+        return resolved
+
+    def save(self, path=ALIASES_FILE):
+        data = {'version': VERSION, 'channels': self.channels, 'keys': self.keys}
+        return write_if_changed(path, json.dumps(data, indent=1, sort_keys=True, ensure_ascii=False).encode('utf-8'),
+                                formats=())
+
+    @classmethod
+    def load(cls, path=ALIASES_FILE):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError(f"{path}: version de indice no soportada ({data.get('version')})")
+        return cls(data['channels'], data['keys'])
+
+
+def compile_aliases(paths, overrides=None):
+    """AliasIndex de las guias en paths (la primera manda en el ID y nombre canonicos)."""
+    nodes = []  # (fuente, id, nombres)
+    for path in paths:
+        source = source_name(path)
+        nodes.extend((source, cid, names) for cid, names in read_channels(path))
+
+    parent = list(range(len(nodes)))
+    sources = [{node[0]} for node in nodes]  # Fuentes de cada componente (valido en la raiz)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j, force=False):
+        ri, rj = find(i), find(j)
+        if ri == rj or (not force and sources[ri] & sources[rj]):
+            return False  # Dos canales distintos de una misma fuente no se juntan por nombre
+        ri, rj = min(ri, rj), max(ri, rj)  # La raiz queda en el nodo de la fuente con mas prioridad
+        parent[rj] = ri
+        sources[ri] |= sources[rj]
+        return True
+
+    by_id, by_name = {}, {}
+    for n, (source, cid, names) in enumerate(nodes):
+        by_id.setdefault(cid, n)
+        # Numeros (IDs de tvtv, LCN) no son nombres: solo valen como id: o num:<fuente>
+        for key in {alias_key(v) for v in [cid, *names] if not v.isdigit()}:
+            if key:
+                by_name.setdefault(key, []).append(n)
+    for members in by_name.values():
+        for n in members[1:]:
+            union(members[0], n)
+
+    forced = []
+    for canonical, aliases in (overrides or {}).items():
+        found = [n for n in (by_id.get(a, by_name.get(alias_key(a), [None])[0]) for a in aliases) if n is not None]
+        for n in found[1:]:
+            union(found[0], n, force=True)
+        if found:
+            forced.append((found[0], canonical))
+        else:
+            logger.warning(f"Alias override {canonical!r}: none of {aliases} found in the guides")
+    canonical_names = {find(n): canonical for n, canonical in forced}
+
+    channels, keys, slot = [], {}, {}
+    for n, (source, cid, names) in enumerate(nodes):
+        root = find(n)
+        if root not in slot:
+            slot[root] = len(channels)
+            _, root_id, root_names = nodes[root]
+            channels.append({'id': canonical_names.get(root, root_id),
+                             'name': canonical_names.get(root) or (root_names[0] if root_names else root_id),
+                             'members': {}})
+        idx = slot[root]
+        channels[idx]['members'].setdefault(source, []).append(cid)
+        keys.setdefault('id:' + cid, idx)
+        for name in names:
+            if name.isdigit():
+                keys.setdefault(f"num:{source}:{name}", idx)
+    for entry_idx, entry in enumerate(channels):
+        # IDs canonicos de overrides: no pueden ser el ID de otro canal (resolve() devolveria ese)
+        if keys.setdefault('id:' + entry['id'], entry_idx) != entry_idx:
+            other = channels[keys['id:' + entry['id']]]
+            raise ValueError(f"Alias override {entry['id']!r} is already an id of channel {other['id']!r} "
+                             f"({other['members']}) - pick another canonical name")
+    # Nombres: el primer canal (por prioridad) que lo usa; tambien el nombre canonico
+    for key, members in by_name.items():
+        keys.setdefault('name:' + key, slot[find(members[0])])
+    for entry_idx, entry in enumerate(channels):
+        key = alias_key(entry['name'])
+        if key:
+            keys.setdefault('name:' + key, entry_idx)
+
+    index = AliasIndex(channels, keys)
+    shared = [c for c in channels if len(c['members']) > 1]
+    logger.info(f"Alias index: {len(nodes)} channels from {len(paths)} guides -> {len(channels)} canonical "
+                f"({len(shared)} in several sources), {len(keys)} keys")
+    for entry in shared:
+        logger.info(f"  {entry['id']}: {entry['members']}")
+    return index
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Indice de alias de canal entre fuentes.")
+    parser.add_argument('--indice', default=ALIASES_FILE, help=f"JSON compilado (default {ALIASES_FILE})")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    comp = sub.add_parser('compile', help="Compila el indice desde las guias (en orden de prioridad)")
+    comp.add_argument('guias', nargs='*', help=f"Default: {' '.join(DEFAULT_SOURCES)}")
+    comp.add_argument('--overrides', default=None, help="JSON {canonico: [alias, ...]} con uniones manuales")
+    res = sub.add_parser('resolve', help="Muestra el canal canonico de cada ID o nombre")
+    res.add_argument('valores', nargs='+')
+    res.add_argument('--fuente', default=None, help="Fuente para resolver numeros de canal (p.ej. guia_filtrada)")
+    args = parser.parse_args()
+
+    if args.comando == 'compile':
+        overrides = None
+        if args.overrides:
+            with open(args.overrides, encoding='utf-8') as f:
+                overrides = json.load(f)
+        paths = args.guias or [p for p in DEFAULT_SOURCES if os.path.exists(p)]
+        compile_aliases(paths, overrides).save(args.indice)
+    else:
+        index = AliasIndex.load(args.indice)
+        for value in args.valores:
+            print(f"{value}\t{index.resolve(value, args.fuente)}")
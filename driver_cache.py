@@ -0,0 +1,63 @@
+"""Ruta de chromedriver cacheada entre corridas.
+
+ChromeDriverManager().install() consulta la red (y a veces descarga) en cada
+corrida. Aqui se resuelve una sola vez, se copia a un directorio de cache y se
+anota en driver.json; las corridas siguientes usan esa copia sin red.
+
+Env:
+    CHROMEDRIVER_PATH        binario explicito (gana sobre todo)
+    CHROMEDRIVER_VERSION     version fijada (vacio = la que elija webdriver_manager)
+    CHROMEDRIVER_CACHE_DIR   default ~/.cache/xmldata/chromedriver
+"""
+import json
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('CHROMEDRIVER_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'xmldata', 'chromedriver'))
+PINNED_VERSION = os.environ.get('CHROMEDRIVER_VERSION', '')
+META_FILE = 'driver.json'
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def invalidate(cache_dir=CACHE_DIR):
+    """Olvida el driver cacheado (p.ej. si Chrome se actualizo y ya no coincide)."""
+    try:
+        os.remove(os.path.join(cache_dir, META_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def chromedriver_path(version=PINNED_VERSION, cache_dir=CACHE_DIR):
+    """Ruta a un chromedriver ejecutable; solo usa la red si no hay uno cacheado."""
+    explicit = os.environ.get('CHROMEDRIVER_PATH')
+    if explicit and os.access(explicit, os.X_OK):
+        return explicit
+
+    meta = _read_meta(cache_dir)
+    path = meta.get('path')
+    if path and os.access(path, os.X_OK) and (not version or meta.get('version') == version):
+        logger.info(f"Using cached chromedriver {meta.get('version') or 'latest'}: {path}")
+        return path
+
+    from webdriver_manager.chrome import ChromeDriverManager  # Solo si hay que descargar
+    installed = ChromeDriverManager(driver_version=version or None).install()
+    dest_dir = os.path.join(cache_dir, version or 'latest')
+    os.makedirs(dest_dir, exist_ok=True)
+    dest = os.path.join(dest_dir, os.path.basename(installed))
+    shutil.copy2(installed, dest)
+    with open(os.path.join(cache_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'path': dest, 'source': installed, 'installed_at': int(time.time())}, f)
+    logger.info(f"Chromedriver cached at {dest}")
+    return dest
@@ -0,0 +1,210 @@
+"""Completa desc/category de guias pobres (epgmvs.xml, mlb.xml) con una guia rica.
+
+Los programas de la fuente rica (guia_filtrada.xml, guiamix.xml) que tienen
+desc o category se indexan por (trigrama del titulo normalizado, bucket de
+MATCH_BUCKET segundos del start). Cada programa de la guia pobre consulta solo
+las claves de sus trigramas en su bucket y los vecinos, cuenta trigramas en
+comun por candidato y se queda con el de mayor similitud (Jaccard) si pasa
+MIN_SCORE y empieza a menos de MAX_SHIFT segundos. Costo ~ lineal en programas.
+
+Con el indice de alias (channel_aliases.json, ver channel_aliases.py) cada canal
+que tiene contraparte en las fuentes solo se completa desde esa contraparte; los
+canales sin contraparte siguen buscando en todas las filas.
+
+Los campos que faltan se insertan en los bytes del <programme> (despues de
+title/sub-title, con la misma indentacion), asi que el resto del XML queda
+intacto: premiere, subtitles, credits, etc.
+
+Uso: python enrich.py epgmvs.xml mlb.xml [--fuente guia_filtrada.xml ...] [--indice channel_aliases.json]
+"""
+from collections import Counter
+from itertools import chain
+from xml.sax.saxutils import escape, quoteattr
+import argparse
+import io
+import logging
+import mmap
+import os
+import re
+
+from channel_aliases import ALIASES_FILE, AliasIndex, read_channels, source_name
+from epg_output import write_if_changed
+from guide_snapshot import load_guide, snapshot_xmltv
+from procesar_xml import campos_programa, delimitar_tv, escanear_elementos, normalizar_texto
+from xmltv_utils import parse_xmltv_time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOURCES = ['guia_filtrada.xml', 'guiamix.xml']
+DEFAULT_TARGETS = ['epgmvs.xml', 'mlb.xml']
+MATCH_BUCKET = 1800
+MAX_SHIFT = int(os.environ.get('ENRICH_MAX_SHIFT', '1800'))
+MIN_SCORE = float(os.environ.get('ENRICH_MIN_SCORE', '0.6'))
+
+_RE_NO_ALNUM = re.compile(r'[^0-9a-z]+')
+_RE_START = re.compile(rb'\sstart=(["\'])(.*?)\1')
+_RE_CHANNEL = re.compile(rb'\schannel=(["\'])(.*?)\1')
+_RE_TITLE = re.compile(rb'([ \t\r\n]*)<title\b[^>]*>.*?</title>', re.DOTALL)
+_RE_AFTER = re.compile(rb'</(?:title|sub-title|desc)>')
+
+
+def title_key(title):
+    """Titulo normalizado: minusculas, sin acentos ni puntuacion."""
+    return _RE_NO_ALNUM.sub(' ', normalizar_texto(title)).strip()
+
+
+def trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)} if key else set()
+
+
+class EnrichmentIndex:
+    """Indice (trigrama, bucket) -> filas de la fuente rica."""
+
+    def __init__(self, bucket=MATCH_BUCKET, max_shift=MAX_SHIFT, min_score=MIN_SCORE):
+        self.bucket = bucket
+        self.max_shift = max_shift
+        self.min_score = min_score
+        self.postings = {}
+        self.rows = []  # (start, n_trigramas, desc, categorias, lang)
+        self.row_channels = []  # Canal canonico de cada fila (None sin indice de alias)
+        self.channels = set()
+
+    def add_guide(self, guide, canonical=None):
+        """canonical: {id de canal de guide: id canonico} (AliasIndex.canonical_map)."""
+        canonical = canonical or {}
+        for i in range(len(guide)):
+            p = guide[i]
+            if not p.desc and not p.categories:
+                continue
+            grams = trigrams(title_key(p.title))
+            if not grams:
+                continue
+            row = len(self.rows)
+            self.rows.append((p.start, len(grams), p.desc, p.categories, p.lang))
+            self.row_channels.append(canonical.get(p.channel))
+            b = p.start // self.bucket
+            for g in grams:
+                self.postings.setdefault((g, b), []).append(row)
+        self.channels.update(canonical.values())
+        return self
+
+    def lookup(self, title, start, channel=None):
+        """Fila de la fuente que mejor coincide con (title, start), o None.
+
+        channel (canonico): si las fuentes lo tienen, solo se consideran sus filas.
+        """
+        if channel not in self.channels:
+            channel = None
+        grams = trigrams(title_key(title))
+        if not grams:
+            return None
+        b = start // self.bucket
+        reach = -(-self.max_shift // self.bucket)
+        get = self.postings.get
+        shared = Counter(chain.from_iterable(get((g, nb), ()) for g in grams
+                                             for nb in range(b - reach, b + reach + 1)))
+        best, best_key = None, None
+        for row, common in shared.items():
+            if channel is not None and self.row_channels[row] != channel:
+                continue
+            r_start, r_grams = self.rows[row][0], self.rows[row][1]
+            shift = abs(r_start - start)
+            if shift > self.max_shift:
+                continue
+            score = common / (len(grams) + r_grams - common)
+            if score >= self.min_score and (best_key is None or (score, -shift) > best_key):
+                best, best_key = row, (score, -shift)
+        return None if best is None else self.rows[best]
+
+
+def _enrich_element(element, match):
+    """Inserta desc/category faltantes en los bytes de un <programme>; None si no cambia."""
+    campos = campos_programa(element)
+    _, _, desc, categories, lang = match
+    lang_attr = f" lang={quoteattr(lang)}" if lang else ''
+    title = _RE_TITLE.search(element)
+    if not title:
+        return None
+    indent = title.group(1)
+    insert = []
+    if desc and 'desc' not in campos:
+        insert.append(f"<desc{lang_attr}>{escape(desc)}</desc>")
+    if categories and 'category' not in campos:
+        insert.extend(f"<category{lang_attr}>{escape(c)}</category>" for c in categories)
+    if not insert:
+        return None
+    # Despues del ultimo title/sub-title/desc (orden del DTD de XMLTV)
+    pos = max(m.end() for m in _RE_AFTER.finditer(element))
+    added = b''.join(indent + s.encode('utf-8') for s in insert)
+    return element[:pos] + added + element[pos:]
+
+
+def enrich_file(path, index, aliases=None):
+    """Reescribe path con los campos completados; retorna cuantos programas cambiaron."""
+    canonical = {}
+    if aliases is not None:
+        canonical = aliases.canonical_map([cid for cid, _ in read_channels(path)], source_name(path))
+    out = io.BytesIO()
+    enriched = 0
+    with open(path, 'rb') as f_in, mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        inicio, fin = delimitar_tv(buf)
+        out.write(buf[:inicio])
+        cola = inicio
+        for tag, a, b, _ in escanear_elementos(buf, inicio, fin):
+            element, cola = buf[a:b], b
+            if tag == b'programme':
+                head = element[:element.index(b'>')]
+                start = _RE_START.search(head)
+                title = _RE_TITLE.search(element)
+                if start and title:
+                    text = campos_programa(title.group(0)).get('title', [''])[0]
+                    channel = _RE_CHANNEL.search(head)
+                    channel = canonical.get(channel.group(2).decode('utf-8')) if channel else None
+                    match = index.lookup(text, parse_xmltv_time(start.group(2).decode('ascii')), channel)
+                    new = _enrich_element(element, match) if match else None
+                    if new is not None:
+                        element = new
+                        enriched += 1
+            out.write(element)
+        out.write(buf[cola:])
+    if enriched and write_if_changed(path, out.getvalue()):
+        snapshot_xmltv(path)
+    logger.info(f"{path}: {enriched} programmes enriched")
+    return enriched
+
+
+def build_index(sources, aliases=None):
+    index = EnrichmentIndex()
+    for path in sources:
+        guide = load_guide(path)
+        index.add_guide(guide, aliases.canonical_map(guide.channel_ids, source_name(path)) if aliases else None)
+    logger.info(f"Enrichment index: {len(index.rows)} programmes, {len(index.postings)} keys, "
+                f"{len(index.channels)} aliased channels")
+    return index
+
+
+def load_aliases(path=ALIASES_FILE):
+    """AliasIndex de path, o None si no hay (o no se puede leer): enrich sigue sin restringir canales."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return AliasIndex.load(path)
+    except (ValueError, KeyError, OSError) as e:
+        logger.warning(f"Alias index {path} unusable ({e}) - matching across all channels")
+        return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Completa desc/category de guias pobres desde guias ricas.")
+    parser.add_argument('guias', nargs='*', help=f"Guias a completar (default: {' '.join(DEFAULT_TARGETS)})")
+    parser.add_argument('--fuente', action='append', default=None,
+                        help=f"Guia rica (repetible; default: {' '.join(DEFAULT_SOURCES)})")
+    parser.add_argument('--indice', default=ALIASES_FILE,
+                        help=f"Indice de alias de channel_aliases.py (default {ALIASES_FILE}, opcional)")
+    args = parser.parse_args()
+    aliases = load_aliases(args.indice)
+    index = build_index([p for p in (args.fuente or DEFAULT_SOURCES) if os.path.exists(p)], aliases)
+    for target in args.guias or [p for p in DEFAULT_TARGETS if os.path.exists(p)]:
+        enrich_file(target, index, aliases)
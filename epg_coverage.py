@@ -0,0 +1,142 @@
+"""Huecos de cobertura por canal y plan de re-fetch dirigido (NumPy).
+
+Carga start/stop de cada guia (via snapshot, sin parsear XML si esta al dia),
+ordena por (canal, start) y calcula en forma vectorizada, sobre la ventana
+[ahora, ahora + HORIZON_HOURS):
+
+    gaps       tramos sin programa (incluye el inicio y el final de la ventana)
+    overlaps   programas que se pisan con el anterior del mismo canal
+    cobertura  fraccion de la ventana cubierta, y hasta donde llega cada canal
+
+El plan de re-fetch son pares (canal, [start, stop)) alineados a la hora y
+fusionados si quedan a menos de MERGE_GAP. Solo lo consume el daemon
+(MvshubSource.refetch_gaps en epg_daemon.py), que pide esas ventanas en vez de
+la semana completa; las corridas de los workflows siempre piden la semana.
+Tipico: canales vacios en mlb.xml, o paginas de epgcache truncadas en mvshub
+(size=100) que dejan sin cubrir el final de la semana.
+
+Uso (solo reporte): python epg_coverage.py epgmvs.xml mlb.xml [--horas 48]
+"""
+from collections import namedtuple
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from guide_snapshot import load_guide
+
+logger = logging.getLogger(__name__)
+
+HORIZON_HOURS = float(os.environ.get('COVERAGE_HORIZON_HOURS', '48'))
+MIN_GAP = int(os.environ.get('COVERAGE_MIN_GAP', '300'))  # Cortes mas chicos no cuentan como hueco
+MERGE_GAP = int(os.environ.get('COVERAGE_MERGE_GAP', '3600'))
+ALIGN = 3600  # mvshub redondea dateFrom/dateTo a la hora
+_CH_SHIFT = 34  # canal << 34 + segundos desde la ventana: maximo acumulado por canal en un solo pase
+
+Coverage = namedtuple('Coverage', 'channel_ids window coverage last_stop gaps overlaps')
+# gaps / overlaps: tupla (canal, lo, hi) de arrays int64, canal = indice en channel_ids
+
+
+def guide_arrays(guide):
+    """(canal, start, stop) como int64 ordenados por (canal, start); sin copiar las columnas del Guide."""
+    ch = np.frombuffer(guide.channel, dtype=np.uint32).astype(np.int64)
+    start = np.frombuffer(guide.start, dtype=np.int64)
+    stop = np.frombuffer(guide.stop, dtype=np.int64)
+    order = np.lexsort((start, ch))
+    return ch[order], start[order], stop[order]
+
+
+def _running_end(ch, stop, base):
+    """Maximo acumulado de stop dentro de cada canal (ch ordenado), sin loop por canal."""
+    key = (ch << _CH_SHIFT) + (stop - base)
+    return np.maximum.accumulate(key) - (ch << _CH_SHIFT) + base if len(key) else key
+
+
+def analyze(guide, now=None, horizon_hours=HORIZON_HOURS, min_gap=MIN_GAP):
+    """Coverage de guide sobre [now, now + horizon_hours)."""
+    now = int(now if now is not None else time.time())
+    lo, hi = now, now + int(horizon_hours * 3600)
+    n_ch = len(guide.channel_ids)
+    ch_all, start_all, stop_all = guide_arrays(guide)
+
+    last_stop = np.full(n_ch, -1, dtype=np.int64)
+    np.maximum.at(last_stop, ch_all, stop_all)
+
+    inside = (stop_all > lo) & (start_all < hi) & (stop_all > start_all)
+    ch = ch_all[inside]
+    start = np.clip(start_all[inside], lo, hi)
+    stop = np.clip(stop_all[inside], lo, hi)
+    end = _running_end(ch, stop, lo)
+
+    first = np.ones(len(ch), dtype=bool)
+    first[1:] = ch[1:] != ch[:-1]
+    last = np.ones(len(ch), dtype=bool)
+    last[:-1] = first[1:]
+    follow = ~first[1:]  # Pares (i, i+1) del mismo canal
+
+    # Huecos: antes del primero, entre consecutivos (contra lo ya cubierto) y despues del ultimo
+    empty = np.setdiff1d(np.arange(n_ch), ch)
+    gap_ch = np.concatenate([ch[first], ch[1:][follow], ch[last], empty])
+    gap_lo = np.concatenate([np.full(first.sum(), lo), end[:-1][follow], end[last], np.full(len(empty), lo)])
+    gap_hi = np.concatenate([start[first], start[1:][follow], np.full(last.sum(), hi), np.full(len(empty), hi)])
+    size = gap_hi - gap_lo
+    uncovered = np.bincount(gap_ch[size > 0], weights=size[size > 0], minlength=n_ch)
+    coverage = 1 - uncovered / max(1, hi - lo)
+
+    big = size >= max(1, min_gap)
+    order = np.lexsort((gap_lo[big], gap_ch[big]))
+    gaps = tuple(a[big][order] for a in (gap_ch, gap_lo, gap_hi))
+
+    over = follow & (start[1:] < end[:-1])
+    overlaps = (ch[1:][over], start[1:][over], np.minimum(end[:-1], stop[1:])[over])
+    return Coverage(list(guide.channel_ids), (lo, hi), coverage, last_stop, gaps, overlaps)
+
+
+def refetch_plan(cov, align=ALIGN, merge_gap=MERGE_GAP):
+    """[(channel_id, start, stop)] a pedir: huecos alineados a align y fusionados por canal."""
+    ch, lo, hi = cov.gaps
+    if not len(ch):
+        return []
+    lo = np.maximum(lo // align * align, cov.window[0] // align * align)
+    hi = -(-hi // align) * align
+    end = _running_end(ch, hi, lo.min())
+    new = np.ones(len(ch), dtype=bool)
+    new[1:] = (ch[1:] != ch[:-1]) | (lo[1:] > end[:-1] + merge_gap)
+    starts = np.flatnonzero(new)
+    stops = np.maximum.reduceat(hi, starts)
+    return [(cov.channel_ids[c], int(a), int(b)) for c, a, b in zip(ch[starts], lo[starts], stops)]
+
+
+def log_report(path, cov):
+    lo, hi = cov.window
+    incomplete = np.flatnonzero(cov.coverage < 1)
+    gaps_per = np.bincount(cov.gaps[0], minlength=len(cov.channel_ids))
+    for c in incomplete:
+        horizon = (cov.last_stop[c] - lo) / 3600 if cov.last_stop[c] >= 0 else 0
+        logger.info(f"{path}: {cov.channel_ids[c]} {cov.coverage[c]:.1%} covered, {gaps_per[c]} gaps, "
+                    f"guide ends {horizon:+.1f}h from now")
+    logger.info(f"{path}: {len(cov.channel_ids) - len(incomplete)}/{len(cov.channel_ids)} channels fully covered "
+                f"for {(hi - lo) / 3600:.0f}h, {len(cov.gaps[0])} gaps, {len(cov.overlaps[0])} overlaps")
+
+
+def plan_for_guides(paths, now=None, horizon_hours=HORIZON_HOURS, min_gap=MIN_GAP):
+    """Plan combinado de varias guias: [{source, channel, start, stop}]."""
+    plan = []
+    for path in paths:
+        cov = analyze(load_guide(path), now, horizon_hours, min_gap)
+        log_report(path, cov)
+        plan.extend({'source': path, 'channel': cid, 'start': a, 'stop': b} for cid, a, b in refetch_plan(cov))
+    return plan
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Huecos de cobertura por canal y plan de re-fetch.")
+    parser.add_argument('guias', nargs='+')
+    parser.add_argument('--horas', type=float, default=HORIZON_HOURS, help="Ventana desde ahora (default 48)")
+    parser.add_argument('--min-gap', type=int, default=MIN_GAP, help="Segundos minimos para contar un hueco")
+    args = parser.parse_args()
+    plan = plan_for_guides(args.guias, horizon_hours=args.horas, min_gap=args.min_gap)
+    logger.info(f"Refetch plan: {len(plan)} windows, {sum(p['stop'] - p['start'] for p in plan) / 3600:.1f}h total")
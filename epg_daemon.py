@@ -0,0 +1,317 @@
+"""Modo daemon: mantiene todo caliente y refresca cada fuente con su propia cadencia.
+
+En vez de regenerar todo desde cero por cron, un solo proceso conserva las
+sessions HTTP (pools keep-alive), las credenciales de mvshub, el scraper de
+tvtv y los eventos ya descargados, y corre jobs periodicos:
+
+    epgtalk   descarga condicional (ETag/Last-Modified) + filtro mmap -> guia_filtrada.xml
+    guiamix   descarga condicional -> guiamix.xml
+    mlb       grid de tvtv -> mlb.xml (canal volatil: cadencia corta)
+    mvshub    por canal: ventana cercana a "ahora" seguido, semana completa de vez en cuando,
+              y cada hora solo los huecos que encuentra epg_coverage; una salida por
+              lineup de MVS_LINEUPS (epgmvs.xml + epgmvs_<lineup>_<region>.xml)
+
+Cada salida se reescribe (atomica, con .gz/.xz y snapshot) solo si cambio.
+
+Uso: python epg_daemon.py [--once] [--sources epgtalk,guiamix,mlb,mvshub]
+"""
+from datetime import datetime, timedelta
+import argparse
+import heapq
+import importlib.util
+import io
+import logging
+import os
+import time
+
+from epg_output import write_if_changed
+from guide_snapshot import snapshot_xmltv
+from http_pool import PooledSession
+from run_budget import RunBudget
+
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+EPGTALK_URL = os.environ.get('DAEMON_EPGTALK_URL', "https://raw.githubusercontent.com/acidjesuz/EPGTalk/master/guide.xml")
+GUIAMIX_URL = os.environ.get('DAEMON_GUIAMIX_URL', "https://www.open-epg.com/generate/CDgwm3SqTb.xml")
+DOWNLOAD_USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                       "Chrome/88.0.4324.96 Safari/537.36")
+
+# Cadencias en segundos (env para ajustar sin tocar código)
+EPGTALK_INTERVAL = int(os.environ.get('DAEMON_EPGTALK_INTERVAL', str(6 * 3600)))
+GUIAMIX_INTERVAL = int(os.environ.get('DAEMON_GUIAMIX_INTERVAL', str(6 * 3600)))
+MLB_INTERVAL = int(os.environ.get('DAEMON_MLB_INTERVAL', str(15 * 60)))
+MVSHUB_FULL_INTERVAL = int(os.environ.get('DAEMON_MVSHUB_FULL_INTERVAL', str(6 * 3600)))
+MVSHUB_NEAR_INTERVAL = int(os.environ.get('DAEMON_MVSHUB_NEAR_INTERVAL', str(30 * 60)))
+MVSHUB_NEAR_HOURS = int(os.environ.get('DAEMON_MVSHUB_NEAR_HOURS', '6'))
+MVSHUB_AUTH_TTL = int(os.environ.get('DAEMON_MVSHUB_AUTH_TTL', str(6 * 3600)))
+# Canales mvshub volátiles (deportes en vivo, etc.): ventana cercana con la cadencia de MLB
+VOLATILE_CHANNELS = {int(c) for c in os.environ.get('DAEMON_VOLATILE_CHANNELS', '').split(',') if c.strip()}
+# Cada cuánto se buscan huecos en epgmvs.xml y se re-piden solo esas ventanas (epg_coverage)
+COVERAGE_INTERVAL = int(os.environ.get('DAEMON_COVERAGE_INTERVAL', str(3600)))
+MIN_RETRY = 60
+
+
+def load_script(name, filename):
+    """Importa un script con guiones en el nombre (mvshub-epg-generator.py)."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def publish(path, data):
+    """Reescribe path solo si cambió; regenera el snapshot en ese caso."""
+    changed = write_if_changed(path, data)
+    if changed:
+        snapshot_xmltv(path)
+        logger.info(f"{path} updated ({len(data)} bytes)")
+    else:
+        logger.info(f"{path} unchanged")
+    return changed
+
+
+class Job:
+    """Tarea periódica; run() retorna True si cambió alguna salida."""
+
+    def __init__(self, name, interval, func, first_delay=0):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.first_delay = first_delay
+        self.failures = 0
+
+    def run(self):
+        return self.func()
+
+    def next_delay(self, ok):
+        if ok:
+            self.failures = 0
+            return self.interval
+        self.failures += 1
+        return min(self.interval, MIN_RETRY * 2 ** (self.failures - 1))
+
+
+class ConditionalDownload:
+    """GET con If-None-Match/If-Modified-Since sobre una session keep-alive."""
+
+    def __init__(self, session, url):
+        self.session = session
+        self.url = url
+        self.validators = {}
+
+    def fetch(self):
+        """Bytes nuevos, o None si el servidor respondió 304."""
+        resp = self.session.get(self.url, headers=self.validators, timeout=120)
+        if resp.status_code == 304:
+            logger.info(f"{self.url}: 304 Not Modified")
+            return None
+        resp.raise_for_status()
+        self.validators = {}
+        if resp.headers.get('ETag'):
+            self.validators['If-None-Match'] = resp.headers['ETag']
+        if resp.headers.get('Last-Modified'):
+            self.validators['If-Modified-Since'] = resp.headers['Last-Modified']
+        return resp.content
+
+
+class EpgTalkSource:
+    def __init__(self, session):
+        from procesar_xml import canales_mexico  # El filtro del workflow diario
+        self.canales = canales_mexico
+        self.download = ConditionalDownload(session, EPGTALK_URL)
+
+    def refresh(self):
+        from procesar_xml import filtrar_epg_mmap
+        raw = self.download.fetch()
+        if raw is None:
+            return False
+        write_if_changed('guia.xml', raw, formats=())
+        out = io.BytesIO()
+        filtrar_epg_mmap('guia.xml', out, self.canales)
+        return publish('guia_filtrada.xml', out.getvalue())
+
+
+class GuiamixSource:
+    def __init__(self, session):
+        self.download = ConditionalDownload(session, GUIAMIX_URL)
+
+    def refresh(self):
+        raw = self.download.fetch()
+        return raw is not None and publish('guiamix.xml', raw)
+
+
+class MlbSource:
+    def __init__(self):
+        import cloudscraper
+        self.gen = load_script('generate_epg', 'generate_epg.py')
+        self.scraper = cloudscraper.create_scraper()  # Conserva el clearance de Cloudflare
+
+    def refresh(self):
+        data = self.gen.fetch_grid(self.scraper, self.gen.grid_url(*self.gen.date_range()))
+        if data is None:
+            raise RuntimeError("tvtv grid fetch failed")
+        out = io.BytesIO()
+        self.gen.write_xmltv(data, out)
+        return publish(self.gen.output_file, out.getvalue())
+
+
+class MvshubSource:
+    """Credenciales + session de mvshub vivas, eventos por canal en memoria."""
+
+    def __init__(self):
+        self.mod = load_script('mvshub_epg_generator', 'mvshub-epg-generator.py')
+        self.mod.RUN_BUDGET = RunBudget(None)  # Sin deadline global: cada job tiene sus timeouts
+        self.session = None
+        self.auth_at = 0
+        self.events = {}  # chan_id -> {startDateTime: evento}
+        self.targets = None  # Lineups de MVS_LINEUPS; la región por default sale del primer init
+        self.previous_guides = {}
+
+    def ensure_auth(self):
+        m = self.mod
+        if self.session is not None and time.time() - self.auth_at < MVSHUB_AUTH_TTL:
+            return
+        logger.info("mvshub: (re)authenticating")
+        cookies, jwt = m.get_session_via_selenium()
+        if self.session is None:
+            self.session = m.new_session(cookies)
+        else:
+            self.session.set_cookies(cookies, domain=m.COOKIE_DOMAIN)
+        auth_headers = m.decode_jwt(jwt) if jwt else {}
+        ok, account_id, region_id = m.initialize_session(jwt, self.session, m.API_HEADERS)
+        if not ok:
+            account_id, region_id = "7035", "18"
+        if account_id:
+            auth_headers = m.decode_jwt(jwt, account_id=account_id, region_id=region_id)
+        uuid_val, self.session = m.fetch_uuid(jwt, cookies, m.API_HEADERS, account_id=account_id,
+                                              region_id=region_id, session=self.session)
+        if self.targets is None:
+            self.targets = m.parse_lineups(m.MVS_LINEUPS, default_region=region_id)
+            self.previous_guides = {t.output: m.load_previous_guide(t.output) for t in self.targets}
+            self.channel_lineup = m.channel_lineups(self.targets)
+        self.jwt, self.uuid = jwt, uuid_val
+        self.region_auth = m.lineup_auth(jwt, auth_headers, self.targets)
+        self.auth_at = time.time()
+
+    def fetch_window(self, chan_id, start, end):
+        """Pide [start, end) de un canal y reemplaza solo esa ventana en self.events."""
+        self.ensure_auth()
+        target = self.channel_lineup[chan_id]
+        data = self.mod.fetch_channel_epg(self.session, self.uuid, chan_id, start, end,
+                                          self.region_auth[target.region_id], self.jwt, lineup_id=target.lineup_id)
+        if data is None:
+            self.auth_at = 0  # Fuerza re-auth en el próximo intento
+            raise RuntimeError(f"mvshub channel {chan_id} fetch failed")
+        lo, hi = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+        now_ms = int(time.time() * 1000)
+        events = {k: e for k, e in self.events.get(chan_id, {}).items()
+                  if not lo <= k < hi and int(e.get('endDateTime', 0)) > now_ms - 3600 * 1000}
+        for e in data['events']:
+            events[int(e.get('startDateTime', 0))] = e
+        self.events[chan_id] = events
+        self.session.save_state()  # Limite AIMD por host para el próximo arranque
+
+    def refresh_channel(self, chan_id, hours):
+        start = datetime.now()
+        self.fetch_window(chan_id, start, start + timedelta(hours=hours))
+        return self.write(chan_id)
+
+    def refetch_gaps(self):
+        """Re-pide solo los huecos que epg_coverage encuentra en las salidas actuales."""
+        from epg_coverage import analyze, log_report, refetch_plan
+        from guide_snapshot import load_guide
+        self.ensure_auth()
+        plan = set()  # Un canal de varios lineups se pide una vez por hueco
+        for target in self.targets:
+            if not os.path.exists(target.output):
+                continue
+            cov = analyze(load_guide(target.output))
+            log_report(target.output, cov)
+            plan.update((int(cid[len('MVS.'):]), lo, hi) for cid, lo, hi in refetch_plan(cov)
+                        if cid.startswith('MVS.') and cid[len('MVS.'):].isdigit()
+                        and int(cid[len('MVS.'):]) in target.channels)
+        for chan_id, lo, hi in sorted(plan):
+            self.fetch_window(chan_id, datetime.fromtimestamp(lo), datetime.fromtimestamp(hi))
+        return bool(plan) and self.write()
+
+    def write(self, chan_id=None):
+        """Publica cada lineup (o solo los que incluyen chan_id); nunca una guía sin programas."""
+        changed = False
+        for target in self.targets:
+            if chan_id is not None and chan_id not in target.channels:
+                continue
+            epg_list = [{'channelId': c, 'events': sorted(self.events[c].values(),
+                                                          key=lambda e: int(e.get('startDateTime', 0)))}
+                        for c in target.channels if c in self.events]
+            guide = self.mod.events_to_guide(epg_list, self.previous_guides.get(target.output),
+                                             channel_ids=target.channels)
+            if not len(guide):
+                logger.warning(f"{target.output}: no programmes yet - not published")
+                continue
+            out = io.BytesIO()
+            guide.write_xmltv(out, self.mod.TV_ATTRIB)
+            changed = publish(target.output, out.getvalue()) or changed
+        return changed
+
+    def jobs(self):
+        jobs = []
+        # Solo los canales: la región por default (y con ella el nombre de las salidas) sale del init
+        lineups = self.mod.parse_lineups(self.mod.MVS_LINEUPS)
+        for chan_id in dict.fromkeys(c for t in lineups for c in t.channels):
+            near_interval = MLB_INTERVAL if chan_id in VOLATILE_CHANNELS else MVSHUB_NEAR_INTERVAL
+            jobs.append(Job(f"mvshub:{chan_id}:full", MVSHUB_FULL_INTERVAL,
+                            lambda c=chan_id: self.refresh_channel(c, 7 * 24)))
+            # La primera vuelta ya la cubre el job completo
+            jobs.append(Job(f"mvshub:{chan_id}:near", near_interval,
+                            lambda c=chan_id: self.refresh_channel(c, MVSHUB_NEAR_HOURS), first_delay=near_interval))
+        jobs.append(Job("mvshub:gaps", COVERAGE_INTERVAL, self.refetch_gaps, first_delay=COVERAGE_INTERVAL))
+        return jobs
+
+
+def build_jobs(sources):
+    session = PooledSession({'https://raw.githubusercontent.com': 1, 'https://www.open-epg.com': 1})
+    session.headers['User-Agent'] = DOWNLOAD_USER_AGENT
+    jobs = []
+    if 'epgtalk' in sources:
+        jobs.append(Job('epgtalk', EPGTALK_INTERVAL, EpgTalkSource(session).refresh))
+    if 'guiamix' in sources:
+        jobs.append(Job('guiamix', GUIAMIX_INTERVAL, GuiamixSource(session).refresh))
+    if 'mlb' in sources:
+        jobs.append(Job('mlb', MLB_INTERVAL, MlbSource().refresh))
+    if 'mvshub' in sources:
+        jobs.extend(MvshubSource().jobs())
+    return jobs
+
+
+def run(jobs, once=False):
+    """Loop principal: heap de (próxima ejecución, job)."""
+    start = time.monotonic()
+    queue = [(start + (0 if once else job.first_delay), n, job) for n, job in enumerate(jobs)]
+    heapq.heapify(queue)
+    while queue:
+        due, n, job = heapq.heappop(queue)
+        wait = due - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            ok = True
+            changed = job.run()
+            logger.info(f"Job {job.name}: {'changed' if changed else 'no changes'}")
+        except Exception as e:
+            ok = False
+            logger.error(f"Job {job.name} failed: {e}")
+        if not once:
+            heapq.heappush(queue, (time.monotonic() + job.next_delay(ok), n, job))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Daemon que mantiene las guías al día con refrescos incrementales.")
+    parser.add_argument('--once', action='store_true', help="Corre cada job una vez y termina")
+    parser.add_argument('--sources', default='epgtalk,guiamix,mlb,mvshub',
+                        help="Fuentes a refrescar (default: todas)")
+    args = parser.parse_args()
+    os.chdir(HERE)  # Las salidas viven junto a los scripts, como en los workflows
+    run(build_jobs({s.strip() for s in args.sources.split(',')}), once=args.once)
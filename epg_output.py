@@ -0,0 +1,186 @@
+"""Escritura de salidas XMLTV: archivo plano + .gz/.xz en la misma pasada.
+
+Cada compresor corre en su propio thread (zlib/lzma sueltan el GIL), asi la
+serializacion no espera a la compresion. Los archivos se escriben en .tmp y se
+renombran al cerrar, para que nunca quede un XML a medias publicado.
+"""
+import gzip
+import io
+import logging
+import lzma
+import os
+import queue
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Formatos y nivel por env: COMPRESS_FORMATS="gz,xz" (vacio = solo XML plano), COMPRESS_LEVEL=0-9
+DEFAULT_FORMATS = tuple(f.strip() for f in os.environ.get('COMPRESS_FORMATS', 'gz,xz').split(',') if f.strip())
+DEFAULT_LEVEL = os.environ.get('COMPRESS_LEVEL')
+
+_QUEUE_DEPTH = 64
+_CHUNK_SIZE = 256 * 1024  # ElementTree escribe trozos chicos; se agrupan antes de encolar
+
+
+def _open_compressor(fmt, path, level):
+    if fmt == 'gz':
+        raw = open(path, 'wb')
+        # mtime=0 y sin nombre: mismo contenido -> mismo .gz (git no ve cambios falsos)
+        return gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0,
+                             compresslevel=9 if level is None else level), raw
+    if fmt == 'xz':
+        return lzma.open(path, 'wb', preset=6 if level is None else level), None
+    raise ValueError(f"Formato de compresion desconocido: {fmt}")
+
+
+class _CompressorThread(threading.Thread):
+    """Consume bloques de una cola acotada y los escribe comprimidos."""
+
+    def __init__(self, fmt, path, level):
+        super().__init__(name=f"compress-{fmt}", daemon=True)
+        self.path = path
+        self.queue = queue.Queue(maxsize=_QUEUE_DEPTH)
+        self.error = None
+        self._stream, self._raw = _open_compressor(fmt, path, level)
+
+    def run(self):
+        try:
+            while True:
+                chunk = self.queue.get()
+                if chunk is None:
+                    break
+                if self.error is None:
+                    self._stream.write(chunk)
+        except Exception as e:  # Se reporta en close()
+            self.error = e
+            # Sigue drenando para que write() nunca se bloquee
+            while self.queue.get() is not None:
+                pass
+        finally:
+            self._stream.close()
+            if self._raw:
+                self._raw.close()
+
+
+class TeeOutput(io.BufferedIOBase):
+    """File-like binario que escribe path y sus variantes comprimidas a la vez."""
+
+    def __init__(self, path, formats=None, level=None):
+        super().__init__()
+        formats = DEFAULT_FORMATS if formats is None else tuple(formats)
+        if level is None and DEFAULT_LEVEL:
+            level = int(DEFAULT_LEVEL)
+        if level is not None:
+            level = max(0, min(9, level))
+        self.path = path
+        self._plain = open(path + '.tmp', 'wb')
+        self._threads = [_CompressorThread(fmt, f"{path}.{fmt}.tmp", level) for fmt in formats]
+        for t in self._threads:
+            t.start()
+        self._buffer = bytearray()
+        self._failed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= _CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        self._plain.write(chunk)
+        for t in self._threads:
+            t.queue.put(chunk)
+
+    def abort(self):
+        """Descarta todo (por error durante la serializacion o salida que no se debe publicar)."""
+        self._failed = True
+        self._buffer.clear()  # close() -> flush() no debe escribir en el .tmp ya cerrado
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        if not self._failed:
+            self.flush()
+        self._plain.close()
+        for t in self._threads:
+            t.queue.put(None)
+        for t in self._threads:
+            t.join()
+        errors = [t.error for t in self._threads if t.error]
+        super().close()
+        finals = [(self.path + '.tmp', self.path)] + [(t.path, t.path[:-4]) for t in self._threads]
+        if self._failed or errors:
+            for tmp, _ in finals:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            if errors:
+                raise errors[0]
+            return
+        for tmp, final in finals:
+            os.replace(tmp, final)
+        logger.info(f"Wrote {self.path}" + ''.join(f" + {final}" for _, final in finals[1:]))
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
+
+
+def open_output(path, formats=None, level=None):
+    """Abre una salida XMLTV; usar con 'with'. formats=() desactiva la compresion."""
+    return TeeOutput(path, formats=formats, level=level)
+
+
+def write_if_changed(path, data, formats=None, level=None):
+    """Escribe data (bytes) en path (+ comprimidos) solo si difiere del contenido actual."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open_output(path, formats=formats, level=level) as out:
+        out.write(data)
+    return True
+
+
+def compress_existing(path, formats=None, level=None):
+    """Genera .gz/.xz para un XML ya descargado (p.ej. guiamix.xml) sin tocar el original."""
+    formats = DEFAULT_FORMATS if formats is None else tuple(formats)
+    if level is None and DEFAULT_LEVEL:
+        level = int(DEFAULT_LEVEL)
+    threads = [_CompressorThread(fmt, f"{path}.{fmt}.tmp", level) for fmt in formats]
+    for t in threads:
+        t.start()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            for t in threads:
+                t.queue.put(chunk)
+    for t in threads:
+        t.queue.put(None)
+    for t in threads:
+        t.join()
+    for t in threads:
+        if t.error:
+            os.remove(t.path)
+            raise t.error
+        os.replace(t.path, t.path[:-4])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python epg_output.py archivo.xml [archivo2.xml ...]")
+        sys.exit(1)
+    for xml_path in sys.argv[1:]:
+        compress_existing(xml_path)
@@ -0,0 +1,70 @@
+"""Productor/consumidor acotado entre los fetchers y el escritor de XML.
+
+El productor (un hilo) corre produce(put) y va llamando put(item) con cada
+resultado; quien itera bounded_pipeline() recibe los items a medida que llegan.
+La cola tiene maxsize items: si el escritor se atrasa, put() bloquea al
+fetcher, asi que la memoria pico depende de la profundidad de la cola y no del
+tamano de la guia. Mientras el escritor serializa un canal, el fetcher ya esta
+pidiendo el siguiente.
+
+Un error en el productor se re-lanza en el consumidor al final de la iteracion;
+si el consumidor corta antes (excepcion o break), el siguiente put() del
+productor termina su hilo.
+"""
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_DEPTH = int(os.environ.get('PIPELINE_DEPTH', '4'))
+_POLL = 0.5
+_END = object()
+
+
+class PipelineClosed(Exception):
+    """El consumidor dejo de leer; el productor debe terminar."""
+
+
+def bounded_pipeline(produce, maxsize=PIPELINE_DEPTH, name='producer'):
+    """Genera los items que produce(put) va entregando, con a lo sumo maxsize en espera."""
+    items = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=_POLL)
+                return
+            except queue.Full:
+                continue
+        raise PipelineClosed()
+
+    def worker():
+        try:
+            produce(put)
+        except PipelineClosed:
+            logger.info(f"Pipeline {name}: consumer stopped early")
+        except BaseException as e:  # Se re-lanza del lado del consumidor
+            errors.append(e)
+        finally:
+            try:
+                put(_END)
+            except PipelineClosed:
+                pass
+
+    thread = threading.Thread(target=worker, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,281 @@
+"""Servidor HTTP local para las guias generadas.
+
+    GET /xmltv            todas las guias combinadas (canales primero, luego programas)
+    GET /xmltv/<canal>    XMLTV de un solo canal (ID url-encoded, p.ej. /xmltv/MVS.967)
+    GET /now              JSON ahora/siguiente de cada canal
+
+Los XML se arman copiando bytes tal cual de los archivos (escaneo de procesar_xml),
+sin perder credits/rating/etc. Cada respuesta lleva ETag fuerte (sha256 del
+cuerpo), responde 304 a If-None-Match, soporta Range de un solo rango y se sirve
+pre-comprimida con gzip si el cliente la acepta. Las respuestas armadas quedan
+en un LRU que se invalida cuando cambia el mtime/tamano de algun archivo.
+
+Uso: python epg_server.py [--port 8080] [guia.xml ...]
+"""
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+from xml.sax.saxutils import unescape
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+
+from guide_snapshot import load_guide
+from now_next import DEFAULT_SOURCES, now_next_at
+from procesar_xml import delimitar_tv, escanear_elementos
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 256
+XML_HEAD = b"<?xml version='1.0' encoding='utf-8'?>\n<tv generator-info-name=\"xmldata epg_server\">"
+_RE_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+class Response:
+    """Cuerpo ya renderizado + su version gzip y ETags."""
+    __slots__ = ('body', 'gz', 'etag', 'content_type')
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.gz = gzip.compress(body, compresslevel=6, mtime=0)
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.content_type = content_type
+
+
+class EpgStore:
+    """Indice de bytes por canal de cada guia + LRU de respuestas."""
+
+    def __init__(self, paths, cache_size=CACHE_SIZE):
+        self.paths = list(paths)
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._signature = None
+        self._cache = OrderedDict()
+        self._channels = OrderedDict()  # id -> (bytes canal, [bytes programa])
+        self._guides = []
+
+    def _current_signature(self):
+        sig = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                sig.append((path, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                sig.append((path, None, None))
+        return tuple(sig)
+
+    def refresh(self):
+        """Recarga si algun archivo cambio (los generadores reescriben con os.replace)."""
+        sig = self._current_signature()
+        if sig == self._signature:
+            return
+        channels = OrderedDict()
+        guides = []
+        for path, mtime, _ in sig:
+            if mtime is None:
+                continue
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                inicio, fin = delimitar_tv(buf)
+                for tag, a, b, clave in escanear_elementos(buf, inicio, fin):
+                    cid = unescape(clave.decode('utf-8'), {'&quot;': '"', '&apos;': "'"})
+                    entry = channels.setdefault(cid, [b'', []])
+                    if tag == b'channel':
+                        entry[0] = buf[a:b]
+                    else:
+                        entry[1].append(buf[a:b])
+            guides.append(load_guide(path))
+        self._channels, self._guides = channels, guides
+        self._cache.clear()
+        self._signature = sig
+        logger.info(f"Loaded {len(channels)} channels from {sum(1 for s in sig if s[1])} guides - cache cleared")
+
+    def get(self, key):
+        """Response para key ('xmltv', 'xmltv/<id>', 'now:<minuto>') o None si no existe."""
+        with self._lock:
+            self.refresh()
+            resp = self._cache.get(key)
+            if resp is not None:
+                self._cache.move_to_end(key)
+                return resp
+            resp = self._render(key)
+            if resp is not None:
+                self._cache[key] = resp
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return resp
+
+    def _render(self, key):
+        if key == 'xmltv':
+            return Response(self._xml(self._channels.keys()), 'application/xml; charset=utf-8')
+        if key.startswith('xmltv/'):
+            cid = key[len('xmltv/'):]
+            if cid not in self._channels:
+                return None
+            return Response(self._xml([cid]), 'application/xml; charset=utf-8')
+        if key.startswith('now:'):
+            return Response(self._now(int(key[4:]) * 60), 'application/json; charset=utf-8')
+        return None
+
+    def _xml(self, channel_ids):
+        parts = [XML_HEAD]
+        parts += [self._channels[c][0] for c in channel_ids]
+        for c in channel_ids:
+            parts += self._channels[c][1]
+        parts.append(b'\n</tv>\n')
+        return b''.join(parts)
+
+    def _now(self, t):
+        out = {}
+        for guide in self._guides:
+            rows_by_channel = {}
+            for i in range(len(guide)):
+                rows_by_channel.setdefault(guide.channel[i], []).append(i)
+            for idx, cid in enumerate(guide.channel_ids):
+                rows = sorted(rows_by_channel.get(idx, []), key=lambda r: guide.start[r])
+                starts = [guide.start[r] for r in rows]
+                stops = [guide.stop[r] for r in rows]
+                now, nxt = now_next_at(starts, stops, t)
+                out[cid] = {k: ({'start': guide.start[rows[i]], 'stop': guide.stop[rows[i]],
+                                 'title': guide.strings[guide.title[rows[i]]]} if i >= 0 else None)
+                            for k, i in (('now', now), ('next', nxt))}
+        return json.dumps({'time': t, 'channels': out}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class EpgRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'xmldata-epg/1.0'
+    store = None  # EpgStore, asignado en serve()
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def log_message(self, fmt, *args):
+        logger.info("%s - %s", self.address_string(), fmt % args)
+
+    def _handle(self, send_body):
+        path = unquote(urlsplit(self.path).path).rstrip('/')
+        if path == '/xmltv':
+            key = 'xmltv'
+        elif path.startswith('/xmltv/'):
+            key = 'xmltv/' + path[len('/xmltv/'):]
+        elif path == '/now':
+            key = f"now:{int(time.time()) // 60}"  # Un render por minuto
+        else:
+            self.send_error(404)
+            return
+        try:
+            resp = self.store.get(key)
+        except ValueError as e:  # Guia con estructura inesperada
+            logger.error(f"Cannot serve {path}: {e}")
+            self.send_error(500)
+            return
+        if resp is None:
+            self.send_error(404, "Canal desconocido")
+            return
+
+        use_gzip = self._accepts_gzip()
+        body = resp.gz if use_gzip else resp.body
+        etag = resp.etag[:-1] + '-gz"' if use_gzip else resp.etag
+
+        if self._etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self._common_headers(etag, resp, use_gzip)
+            self.end_headers()
+            return
+
+        status, start, end = 200, 0, len(body)
+        rng = self.headers.get('Range')
+        if rng:
+            parsed = self._parse_range(rng, len(body))
+            if parsed == 'invalid':
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if parsed:
+                status, (start, end) = 206, parsed
+
+        self.send_response(status)
+        self._common_headers(etag, resp, use_gzip)
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end - 1}/{len(body)}")
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(memoryview(body)[start:end])
+
+    def _common_headers(self, etag, resp, use_gzip):
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', resp.content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+
+    def _accepts_gzip(self):
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = part.strip().partition(';')
+            if name.strip().lower() in ('gzip', '*'):
+                return params.replace(' ', '') not in ('q=0', 'q=0.0')
+        return False
+
+    @staticmethod
+    def _etag_matches(header, etag):
+        if not header:
+            return False
+        tags = [t.strip() for t in header.split(',')]
+        return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+    @staticmethod
+    def _parse_range(header, size):
+        """(inicio, fin exclusivo), None para ignorar (multi-rango) o 'invalid' (416)."""
+        m = _RE_RANGE.match(header.strip())
+        if not m:
+            return None
+        first, last = m.groups()
+        if not first and not last:
+            return 'invalid'
+        if not first:
+            length = int(last)
+            if length == 0:
+                return 'invalid'
+            return max(0, size - length), size
+        start = int(first)
+        end = min(size, int(last) + 1) if last else size
+        if start >= size or start >= end:
+            return 'invalid'
+        return start, end
+
+
+def serve(paths, host='127.0.0.1', port=8080):
+    EpgRequestHandler.store = EpgStore(paths)
+    EpgRequestHandler.store.refresh()
+    httpd = ThreadingHTTPServer((host, port), EpgRequestHandler)
+    logger.info(f"Serving {len(paths)} guides on http://{host}:{port}/ (/xmltv, /xmltv/<channel>, /now)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Sirve las guias XMLTV con ETag, gzip y endpoints por canal.")
+    parser.add_argument('guias', nargs='*', help=f"Guias a servir (default: {' '.join(DEFAULT_SOURCES)})")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    serve(args.guias or [p for p in DEFAULT_SOURCES if os.path.exists(p)], args.host, args.port)
@@ -0,0 +1,148 @@
+"""Salida fragmentada: un XMLTV por canal y/o por dia, mas un manifest.json.
+
+Los clientes leen el manifest y solo descargan los fragmentos cuyo sha256 cambio.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import xml.etree.ElementTree as ET
+import hashlib
+import json
+import logging
+import os
+import re
+
+from xmltv_utils import parse_xmltv_time
+
+logger = logging.getLogger(__name__)
+
+SHARD_LAYOUTS = ('channel', 'day', 'both')
+MANIFEST_NAME = 'manifest.json'
+
+
+def _safe_name(channel_id, used):
+    """Nombre de archivo estable para un ID de canal (espacios, '+', etc.)."""
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', channel_id).strip('_') or 'canal'
+    if name in used:
+        name = f"{name}-{hashlib.sha1(channel_id.encode('utf-8')).hexdigest()[:8]}"
+    used.add(name)
+    return name
+
+
+def _read_guide(xml_path):
+    """Lee el XMLTV en streaming: (attrs de <tv>, {id: bytes canal}, [(canal, start, stop, bytes)])."""
+    tv_attrib = {}
+    channels = {}
+    programmes = []
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'tv':
+                tv_attrib = dict(elem.attrib)
+            continue
+        if elem.tag == 'channel':
+            elem.tail = None
+            channels[elem.get('id')] = ET.tostring(elem, encoding='utf-8')
+            elem.clear()
+        elif elem.tag == 'programme':
+            elem.tail = None
+            programmes.append((elem.get('channel'), parse_xmltv_time(elem.get('start')),
+                               parse_xmltv_time(elem.get('stop') or elem.get('start')),
+                               ET.tostring(elem, encoding='utf-8')))
+            elem.clear()
+    return tv_attrib, channels, programmes
+
+
+def _render_shard(tv_attrib, channel_ids, channels, progs):
+    """Arma un documento XMLTV completo a partir de elementos ya serializados."""
+    root = ET.Element('tv', tv_attrib)
+    head = ET.tostring(root, encoding='unicode')[:-2] + '>'  # '<tv .../>' -> '<tv ...>'
+    parts = [b"<?xml version='1.0' encoding='utf-8'?>\n", head.encode('utf-8'), b'\n']
+    for cid in channel_ids:
+        if cid in channels:
+            parts += [b'  ', channels[cid], b'\n']
+    for _, _, _, raw in progs:
+        parts += [b'  ', raw, b'\n']
+    parts.append(b'</tv>\n')
+    return b''.join(parts)
+
+
+def _write_if_changed(path, data):
+    """Escribe solo si el contenido cambio (conserva mtime para caches/rsync)."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def write_shards(xml_path, out_dir, by='channel', workers=None):
+    """Genera los fragmentos de xml_path en out_dir y escribe out_dir/manifest.json.
+
+    by: 'channel' (out_dir/channel/<id>.xml), 'day' (out_dir/day/YYYY-MM-DD.xml, dia UTC del start)
+    o 'both'. Retorna el manifest como dict.
+    """
+    if by not in SHARD_LAYOUTS:
+        raise ValueError(f"Layout de shards desconocido: {by} (usa {', '.join(SHARD_LAYOUTS)})")
+    tv_attrib, channels, programmes = _read_guide(xml_path)
+
+    groups = {}  # ruta relativa -> (ids de canal, programas)
+    if by in ('channel', 'both'):
+        by_channel = {cid: [] for cid in channels}
+        for prog in programmes:
+            by_channel.setdefault(prog[0], []).append(prog)
+        used = set()
+        for cid, progs in by_channel.items():
+            groups[f"channel/{_safe_name(cid, used)}.xml"] = ([cid], progs)
+    if by in ('day', 'both'):
+        by_day = {}
+        for prog in programmes:
+            day = datetime.fromtimestamp(prog[1], tz=timezone.utc).strftime('%Y-%m-%d')
+            by_day.setdefault(day, []).append(prog)
+        for day, progs in sorted(by_day.items()):
+            ids = list(dict.fromkeys(p[0] for p in progs))
+            groups[f"day/{day}.xml"] = (ids, progs)
+
+    for sub in {rel.split('/')[0] for rel in groups}:
+        os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+
+    def build(item):
+        rel, (ids, progs) = item
+        data = _render_shard(tv_attrib, ids, channels, progs)
+        changed = _write_if_changed(os.path.join(out_dir, rel), data)
+        return {
+            'path': rel,
+            'channels': ids,
+            'start': min((p[1] for p in progs), default=None),
+            'stop': max((p[2] for p in progs), default=None),
+            'programmes': len(progs),
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        }, changed
+
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        results = list(pool.map(build, groups.items()))
+
+    # Borra fragmentos viejos que ya no estan en el manifest
+    for sub in ('channel', 'day'):
+        sub_dir = os.path.join(out_dir, sub)
+        if not os.path.isdir(sub_dir):
+            continue
+        for name in os.listdir(sub_dir):
+            if name.endswith('.xml') and f"{sub}/{name}" not in groups:
+                os.remove(os.path.join(sub_dir, name))
+
+    manifest = {
+        'source': os.path.basename(xml_path),
+        'generated': int(datetime.now(timezone.utc).timestamp()),
+        'layout': by,
+        'shards': [entry for entry, _ in results],
+    }
+    _write_if_changed(os.path.join(out_dir, MANIFEST_NAME),
+                      json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    logger.info(f"Shards for {xml_path} in {out_dir}: {len(results)} ({sum(c for _, c in results)} changed)")
+    return manifest
@@ -1,10 +1,12 @@
 import cloudscraper  # Reemplaza requests para resolver Cloudflare challenges
-from xml.etree import ElementTree as ET
-from xml.dom import minidom
 from datetime import datetime, timedelta
 import json
 import os
 
+from epg_output import open_output
+from epg_shards import write_shards
+from guide_snapshot import snapshot_xmltv
+
 # Función para convertir ISO a XMLTV time (YYYYMMDDHHMMSSZ)
 def iso_to_xmltv(iso_str):
     dt = datetime.fromisoformat(iso_str.replace('Z', '+00:00'))
@@ -29,20 +31,10 @@ channel_names = {
     72828: 'MLB 8'
 }
 lineup_id = 'USA-MO24443-X'  # Fijo; ajusta si cambia
-
-# Fechas dinámicas: Día actual y siguiente, con horas fijas
-today = datetime.utcnow().date()
-tomorrow = today + timedelta(days=1)
-start_iso = f"{today}T05:00:00.000Z"  # Primera fecha: Hoy 05:00Z
-end_iso = f"{tomorrow}T04:59:00.000Z"  # Segunda fecha: Mañana 04:59Z
-
-# URL dinámica
-channels_str = ','.join(map(str, channel_ids))
-url = f'https://www.tvtv.us/api/v1/lineup/{lineup_id}/grid/{start_iso}/{end_iso}/{channels_str}'
-
-print(f"Generando EPG para rango: {start_iso} a {end_iso}")
-print(f"URL generada: {url}")
-print(f"Canales: {len(channel_ids)} (IDs: {channels_str})")
+tvtv_api = os.environ.get('TVTV_API_URL', 'https://www.tvtv.us/api/v1')  # Otro valor solo para mocks/benchmarks
+output_file = 'mlb.xml'
+shards_dir = os.environ.get('SHARDS_DIR', '')  # Opcional: fragmentos por canal/dia + manifest
+shards_by = os.environ.get('SHARDS_BY', 'channel')
 
 # Headers para simular navegador
 headers = {
@@ -52,80 +44,120 @@ headers = {
     'Referer': 'https://www.tvtv.us/'
 }
 
-# Crear scraper de Cloudflare y fetch JSON
-scraper = cloudscraper.create_scraper()  # Resuelve challenges automáticamente
-response = scraper.get(url, headers=headers)
-if response.status_code != 200:
-    print(f"Error fetching data: {response.status_code} - {response.text[:500]}...")  # Trunca el HTML largo para logs
-    exit(1)
-data = response.json()
-print(f"Datos recibidos: {len(data)} arrays (uno por canal)")
-
-# Crear XML
-tv = ET.Element('tv', attrib={
-    'generator-info-name': 'TVTV.us EPG Converter',
-    'generator-info-url': 'https://www.tvtv.us'
-})
-
-# Añadir canales
-for ch_id in channel_ids:
-    channel = ET.SubElement(tv, 'channel', id=str(ch_id))
-    display_name = ET.SubElement(channel, 'display-name', lang='en')
-    display_name.text = channel_names.get(ch_id, f'MLB Channel {ch_id}')
-
-# Añadir programas (data es array de arrays)
-total_programs = 0
-for idx, programs in enumerate(data):
-    ch_id = channel_ids[idx]
-    if not programs:
-        print(f"No programs for channel {ch_id} ({channel_names.get(ch_id, 'Unknown')})")
-        continue
-    print(f"Canal {ch_id} ({channel_names.get(ch_id, 'Unknown')}): {len(programs)} programas")
-    for prog in programs:
-        start_time = prog['startTime']
-        runtime = prog['runTime']  # En minutos
-        duration = prog['duration']
-        stop_time = calculate_stop(start_time, runtime)
-        
-        programme = ET.SubElement(tv, 'programme', {
-            'start': iso_to_xmltv(start_time),
-            'stop': stop_time,
-            'channel': str(ch_id)
-        })
-        
-        title = ET.SubElement(programme, 'title', lang='en')
-        title.text = prog['title']
-        
-        # Subtítulo (si existe)
-        if 'subtitle' in prog:
-            subtitle = ET.SubElement(programme, 'sub-title', lang='en')
-            subtitle.text = prog['subtitle']
-        
-        # Categoría (basada en type)
-        category = ET.SubElement(programme, 'category', lang='en')
-        category.text = 'Sports Filler' if prog['type'] == 'O' else 'Sports'
-        
-        # Descripción: Solo usar subtitle si existe; de lo contrario, omitir <desc>
-        if 'subtitle' in prog:
-            desc = ET.SubElement(programme, 'desc', lang='en')
-            desc.text = prog['subtitle']
-        
-        # Flags: Mantener premiere y subtitles si aplican (no afectan desc)
-        if 'Live' in prog.get('flags', []):
-            ET.SubElement(programme, 'premiere')
-        
-        if 'CC' in prog.get('flags', []):
-            ET.SubElement(programme, 'subtitles', attrib={'type': 'teletext'})
-        
-        total_programs += 1
-
-# Pretty print y guardar
-rough_string = ET.tostring(tv, 'unicode')
-reparsed = minidom.parseString(rough_string)
-pretty_xml = reparsed.toprettyxml(indent="  ")
+# Fechas dinámicas: Día actual y siguiente, con horas fijas
+def date_range():
+    today = datetime.utcnow().date()
+    tomorrow = today + timedelta(days=1)
+    start_iso = f"{today}T05:00:00.000Z"  # Primera fecha: Hoy 05:00Z
+    end_iso = f"{tomorrow}T04:59:00.000Z"  # Segunda fecha: Mañana 04:59Z
+    return start_iso, end_iso
 
-output_file = 'mlb.xml'
-with open(output_file, 'w', encoding='utf-8') as f:
-    f.write(pretty_xml)
+# URL dinámica
+def grid_url(start_iso, end_iso):
+    channels_str = ','.join(map(str, channel_ids))
+    return f'{tvtv_api}/lineup/{lineup_id}/grid/{start_iso}/{end_iso}/{channels_str}'
+
+# Fetch JSON (data es array de arrays, uno por canal); None si falla
+def fetch_grid(scraper, url):
+    response = scraper.get(url, headers=headers)
+    if response.status_code != 200:
+        print(f"Error fetching data: {response.status_code} - {response.text[:500]}...")  # Trunca el HTML largo para logs
+        return None
+    data = response.json()
+    print(f"Datos recibidos: {len(data)} arrays (uno por canal)")
+    return data
+
+# Escape igual al de minidom.toprettyxml (formato historico de mlb.xml)
+def xml_escape(value):
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+# Un elemento hoja con indentacion; sin texto queda <tag/>
+def leaf_xml(tag, attrs, text=None, indent='    '):
+    attr_str = ''.join(f' {k}="{xml_escape(v)}"' for k, v in attrs.items())
+    if text:
+        return f'{indent}<{tag}{attr_str}>{xml_escape(text)}</{tag}>\n'
+    return f'{indent}<{tag}{attr_str}/>\n'
+
+def channel_xml(ch_id):
+    name = channel_names.get(ch_id, f'MLB Channel {ch_id}')
+    return f'  <channel id="{ch_id}">\n' + leaf_xml('display-name', {'lang': 'en'}, name) + '  </channel>\n'
+
+def programme_xml(ch_id, prog):
+    start_time = prog['startTime']
+    runtime = prog['runTime']  # En minutos
+    stop_time = calculate_stop(start_time, runtime)
+    parts = [f'  <programme start="{iso_to_xmltv(start_time)}" stop="{stop_time}" channel="{ch_id}">\n',
+             leaf_xml('title', {'lang': 'en'}, prog['title'])]
+
+    # Subtítulo (si existe)
+    if 'subtitle' in prog:
+        parts.append(leaf_xml('sub-title', {'lang': 'en'}, prog['subtitle']))
+
+    # Categoría (basada en type)
+    parts.append(leaf_xml('category', {'lang': 'en'}, 'Sports Filler' if prog['type'] == 'O' else 'Sports'))
+
+    # Descripción: Solo usar subtitle si existe; de lo contrario, omitir <desc>
+    if 'subtitle' in prog:
+        parts.append(leaf_xml('desc', {'lang': 'en'}, prog['subtitle']))
+
+    # Flags: Mantener premiere y subtitles si aplican (no afectan desc)
+    if 'Live' in prog.get('flags', []):
+        parts.append(leaf_xml('premiere', {}))
+
+    if 'CC' in prog.get('flags', []):
+        parts.append(leaf_xml('subtitles', {'type': 'teletext'}))
+
+    parts.append('  </programme>\n')
+    return ''.join(parts)
+
+# Escribe el XMLTV en streaming a un file-like binario: canales primero, luego cada
+# canal apenas se recorre (sin árbol ni reparseo con minidom). Retorna el total de programas
+def write_xmltv(data, out):
+    out.write(b'<?xml version="1.0" ?>\n'
+              b'<tv generator-info-name="TVTV.us EPG Converter" generator-info-url="https://www.tvtv.us">\n')
+
+    # Añadir canales
+    for ch_id in channel_ids:
+        out.write(channel_xml(ch_id).encode('utf-8'))
+
+    # Añadir programas (data es array de arrays)
+    total_programs = 0
+    for idx, programs in enumerate(data):
+        ch_id = channel_ids[idx]
+        if not programs:
+            print(f"No programs for channel {ch_id} ({channel_names.get(ch_id, 'Unknown')})")
+            continue
+        print(f"Canal {ch_id} ({channel_names.get(ch_id, 'Unknown')}): {len(programs)} programas")
+        out.write(''.join(programme_xml(ch_id, prog) for prog in programs).encode('utf-8'))
+        total_programs += len(programs)
+
+    out.write(b'</tv>\n')
+    return total_programs
+
+# Snapshot y shards opcionales de mlb.xml ya escrito
+def write_extras():
+    snapshot_xmltv(output_file)  # mlb.xml.snap: recarga sin reparsear
+    if shards_dir:
+        write_shards(output_file, shards_dir, by=shards_by)
+        print(f"Shards escritos en '{shards_dir}' (layout: {shards_by})")
+
+def main():
+    start_iso, end_iso = date_range()
+    url = grid_url(start_iso, end_iso)
+    print(f"Generando EPG para rango: {start_iso} a {end_iso}")
+    print(f"URL generada: {url}")
+    print(f"Canales: {len(channel_ids)} (IDs: {','.join(map(str, channel_ids))})")
+
+    # Crear scraper de Cloudflare y fetch JSON
+    scraper = cloudscraper.create_scraper()  # Resuelve challenges automáticamente
+    data = fetch_grid(scraper, url)
+    if data is None:
+        exit(1)
+
+    with open_output(output_file) as f:  # Tambien escribe mlb.xml.gz y mlb.xml.xz
+        total_programs = write_xmltv(data, f)
+    write_extras()
+    print(f"XMLTV generado exitosamente en '{output_file}' para {len(channel_ids)} canales y {total_programs} programas totales.")
 
-print(f"XMLTV generado exitosamente en '{output_file}' para {len(channel_ids)} canales y {total_programs} programas totales.")
+if __name__ == "__main__":
+    main()
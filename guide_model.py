@@ -0,0 +1,298 @@
+"""Modelo de guia en memoria, por columnas y con strings internados.
+
+En vez de un dict/Element por programa, cada campo es una columna:
+start/stop en array('q') (epoch en segundos), canal en array('I') (indice a
+Guide.channel_ids) y title/sub-title/desc/category/episode como indices a una
+tabla de strings compartida. Titulos y descripciones repetidas ("WIN Noticias")
+se guardan una sola vez. Guide[i] retorna una vista liviana con __slots__.
+
+Es un modelo de lectura/escritura de lo que usan los generadores (title,
+sub-title, desc, category, episode-num); credits, rating, etc. no se guardan.
+"""
+from array import array
+from xml.sax.saxutils import escape, quoteattr
+import xml.etree.ElementTree as ET
+
+from xmltv_utils import format_xmltv_time, parse_xmltv_time
+
+# Separador para varias categorias en un solo string internado
+CATEGORY_SEP = '\x1f'
+
+
+class StringTable:
+    """Tabla de strings internados; el indice 0 es siempre ''."""
+    __slots__ = ('strings', '_index')
+
+    def __init__(self, strings=None):
+        self.strings = list(strings) if strings else ['']
+        self._index = {s: i for i, s in enumerate(self.strings)}
+
+    def intern(self, value):
+        if not value:
+            return 0
+        idx = self._index.get(value)
+        if idx is None:
+            idx = len(self.strings)
+            self._index[value] = idx
+            self.strings.append(value)
+        return idx
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class Programme:
+    """Vista de solo lectura sobre la fila i de un Guide."""
+    __slots__ = ('_guide', '_i')
+
+    def __init__(self, guide, i):
+        self._guide = guide
+        self._i = i
+
+    @property
+    def channel(self):
+        return self._guide.channel_ids[self._guide.channel[self._i]]
+
+    @property
+    def start(self):
+        return self._guide.start[self._i]
+
+    @property
+    def stop(self):
+        return self._guide.stop[self._i]
+
+    @property
+    def title(self):
+        return self._guide.strings[self._guide.title[self._i]]
+
+    @property
+    def sub_title(self):
+        return self._guide.strings[self._guide.sub_title[self._i]]
+
+    @property
+    def desc(self):
+        return self._guide.strings[self._guide.desc[self._i]]
+
+    @property
+    def categories(self):
+        value = self._guide.strings[self._guide.category[self._i]]
+        return tuple(value.split(CATEGORY_SEP)) if value else ()
+
+    @property
+    def episode(self):
+        """(system, valor) de episode-num, o None."""
+        g = self._guide
+        value = g.strings[g.episode[self._i]]
+        return (g.strings[g.episode_system[self._i]], value) if value else None
+
+    @property
+    def lang(self):
+        return self._guide.strings[self._guide.lang[self._i]]
+
+    def __repr__(self):
+        return f"<Programme {self.channel} {format_xmltv_time(self.start)} {self.title!r}>"
+
+
+class Guide:
+    """Guia completa: canales + columnas de programas."""
+
+    COLUMNS = ('start', 'stop', 'channel', 'title', 'sub_title', 'desc',
+               'category', 'episode_system', 'episode', 'lang')
+
+    def __init__(self):
+        self.channel_ids = []
+        self.channel_names = []  # indices a strings
+        self.channel_icons = []  # indices a strings
+        self._channel_index = {}
+        self.strings = StringTable()
+        self.start = array('q')
+        self.stop = array('q')
+        self.channel = array('I')
+        self.title = array('I')
+        self.sub_title = array('I')
+        self.desc = array('I')
+        self.category = array('I')
+        self.episode_system = array('I')
+        self.episode = array('I')
+        self.lang = array('I')
+
+    # --- canales ---
+    def add_channel(self, channel_id, name='', icon=''):
+        """Registra un canal (idempotente) y retorna su indice."""
+        idx = self._channel_index.get(channel_id)
+        if idx is None:
+            idx = len(self.channel_ids)
+            self._channel_index[channel_id] = idx
+            self.channel_ids.append(channel_id)
+            self.channel_names.append(self.strings.intern(name))
+            self.channel_icons.append(self.strings.intern(icon))
+        else:
+            if name and not self.channel_names[idx]:
+                self.channel_names[idx] = self.strings.intern(name)
+            if icon and not self.channel_icons[idx]:
+                self.channel_icons[idx] = self.strings.intern(icon)
+        return idx
+
+    def channel_index(self, channel_id):
+        return self._channel_index.get(channel_id)
+
+    def channel_name(self, channel_id):
+        return self.strings[self.channel_names[self._channel_index[channel_id]]]
+
+    def channel_icon(self, channel_id):
+        return self.strings[self.channel_icons[self._channel_index[channel_id]]]
+
+    # --- programas ---
+    def add_programme(self, channel_id, start, stop, title='', sub_title='', desc='',
+                      categories=(), episode=None, lang=''):
+        """Agrega un programa; start/stop en epoch (segundos). episode = (system, valor)."""
+        intern = self.strings.intern
+        self.channel.append(self.add_channel(channel_id))
+        self.start.append(int(start))
+        self.stop.append(int(stop))
+        self.title.append(intern(title))
+        self.sub_title.append(intern(sub_title))
+        self.desc.append(intern(desc))
+        self.category.append(intern(CATEGORY_SEP.join(c for c in categories if c)))
+        self.episode_system.append(intern(episode[0]) if episode else 0)
+        self.episode.append(intern(episode[1]) if episode else 0)
+        self.lang.append(intern(lang))
+
+    def extend_from(self, other, rows):
+        """Copia las filas rows de otro Guide (re-interna los strings en esta tabla)."""
+        for i in rows:
+            p = other[i]
+            self.add_programme(p.channel, p.start, p.stop, p.title, p.sub_title, p.desc,
+                               p.categories, p.episode, p.lang)
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return Programme(self, i)
+
+    def __iter__(self):
+        return (Programme(self, i) for i in range(len(self)))
+
+    def rows_for(self, channel_id):
+        """Indices de fila del canal, en orden de insercion."""
+        idx = self._channel_index.get(channel_id)
+        if idx is None:
+            return []
+        return [i for i, c in enumerate(self.channel) if c == idx]
+
+    def sort(self):
+        """Reordena todas las columnas por (canal, start)."""
+        order = sorted(range(len(self)), key=lambda i: (self.channel[i], self.start[i]))
+        for name in self.COLUMNS:
+            col = getattr(self, name)
+            setattr(self, name, array(col.typecode, (col[i] for i in order)))
+
+    def memory_size(self):
+        """Bytes aproximados de columnas + strings (sin overhead del dict de internado)."""
+        cols = sum(getattr(self, n).buffer_info()[1] * getattr(self, n).itemsize for n in self.COLUMNS)
+        return cols + sum(len(s.encode('utf-8')) for s in self.strings.strings)
+
+    # --- XMLTV ---
+    @classmethod
+    def from_xmltv(cls, xml_path):
+        """Carga un XMLTV en streaming (iterparse); no retiene Elements."""
+        guide = cls()
+        for _, elem in ET.iterparse(xml_path):
+            if elem.tag == 'channel':
+                icon = elem.find('icon')
+                guide.add_channel(elem.get('id'), elem.findtext('display-name') or '',
+                                  icon.get('src', '') if icon is not None else '')
+                elem.clear()
+            elif elem.tag == 'programme':
+                title = elem.find('title')
+                ep = elem.find('episode-num')
+                guide.add_programme(
+                    elem.get('channel'),
+                    parse_xmltv_time(elem.get('start')),
+                    parse_xmltv_time(elem.get('stop') or elem.get('start')),
+                    title=(title.text or '') if title is not None else '',
+                    sub_title=elem.findtext('sub-title') or '',
+                    desc=elem.findtext('desc') or '',
+                    categories=[c.text for c in elem.findall('category')],
+                    episode=(ep.get('system', ''), ep.text) if ep is not None and ep.text else None,
+                    lang=title.get('lang', '') if title is not None else '')
+                elem.clear()
+        return guide
+
+    def write_xmltv(self, out, tv_attrib=None, channel_ids=None):
+        """Serializa en streaming a un file-like binario (mismo formato que ET.indent, 2 espacios)."""
+        writer = GuideWriter(out, self, tv_attrib, channel_ids)
+        writer.write_rows(self)
+        writer.close()
+
+    def _channel_xml(self, idx):
+        s = self.strings
+        parts = [f"  <channel id={quoteattr(self.channel_ids[idx])}>\n"]
+        if self.channel_names[idx]:
+            parts.append(f"    <display-name>{escape(s[self.channel_names[idx]])}</display-name>\n")
+        if self.channel_icons[idx]:
+            parts.append(f"    <icon src={quoteattr(s[self.channel_icons[idx]])} />\n")
+        parts.append("  </channel>\n")
+        return ''.join(parts)
+
+    def programme_xml(self, i):
+        """Fragmento <programme> de la fila i (con indentacion y salto de linea)."""
+        s = self.strings
+        lang = f" lang={quoteattr(s[self.lang[i]])}" if self.lang[i] else ''
+        parts = [f"  <programme start=\"{format_xmltv_time(self.start[i])}\" "
+                 f"stop=\"{format_xmltv_time(self.stop[i])}\" "
+                 f"channel={quoteattr(self.channel_ids[self.channel[i]])}>\n",
+                 f"    <title{lang}>{escape(s[self.title[i]])}</title>\n"]
+        if self.sub_title[i]:
+            parts.append(f"    <sub-title{lang}>{escape(s[self.sub_title[i]])}</sub-title>\n")
+        if self.desc[i]:
+            parts.append(f"    <desc{lang}>{escape(s[self.desc[i]])}</desc>\n")
+        if self.category[i]:
+            for cat in s[self.category[i]].split(CATEGORY_SEP):
+                parts.append(f"    <category{lang}>{escape(cat)}</category>\n")
+        if self.episode[i]:
+            parts.append(f"    <episode-num system={quoteattr(s[self.episode_system[i]])}>"
+                         f"{escape(s[self.episode[i]])}</episode-num>\n")
+        parts.append("  </programme>\n")
+        return ''.join(parts)
+
+
+class GuideWriter:
+    """Escritura incremental de XMLTV: cabecera y canales al crearlo, programas a medida que llegan.
+
+    Los programas pueden venir de varios Guide (uno chico por canal, la guia
+    anterior como cache...); la salida es la misma que Guide.write_xmltv.
+    """
+
+    def __init__(self, out, channels, tv_attrib=None, channel_ids=None):
+        self.out = out
+        self.written = 0
+        self._wanted = None if channel_ids is None else set(channel_ids)
+        attrs = ''.join(f" {k}={quoteattr(v)}" for k, v in (tv_attrib or {}).items())
+        out.write(f"<?xml version='1.0' encoding='utf-8'?>\n<tv{attrs}>\n".encode('utf-8'))
+        for idx, cid in enumerate(channels.channel_ids):
+            if self._wanted is None or cid in self._wanted:
+                out.write(channels._channel_xml(idx).encode('utf-8'))
+
+    def write_rows(self, guide, rows=None):
+        """Escribe las filas rows de guide (default: todas) y retorna cuantas escribio."""
+        wanted = None if self._wanted is None else {guide.channel_index(c) for c in self._wanted}
+        count = 0
+        for i in range(len(guide)) if rows is None else rows:
+            if wanted is not None and guide.channel[i] not in wanted:
+                continue
+            self.out.write(guide.programme_xml(i).encode('utf-8'))
+            count += 1
+        self.written += count
+        return count
+
+    def close(self):
+        self.out.write(b"</tv>")
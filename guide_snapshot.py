@@ -0,0 +1,156 @@
+"""Snapshot binario de un Guide, para recargar sin volver a parsear el XML.
+
+Formato (little-endian, version 1), archivo '<salida>.xml.snap':
+
+    header   8s magic 'EPGSNAP\\0', H version, H reservado, 32s sha256 del XML fuente,
+             I n_channels, I n_strings, I n_programmes
+    strings  (n_strings + 1) x uint32 offsets, luego el blob utf-8
+    channels n_channels x (I id, I name, I icon)    -- indices a strings
+    (padding a 8 bytes)
+    records  n_programmes x PROGRAMME_RECORD (ancho fijo, mismo orden que Guide.COLUMNS)
+
+load_guide(xml_path) abre el snapshot si su sha256 coincide con el XML y si no
+parsea el XML y regenera el snapshot.
+"""
+from array import array
+import hashlib
+import logging
+import mmap
+import os
+import struct
+
+from guide_model import Guide, StringTable
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EPGSNAP\0'
+VERSION = 1
+SUFFIX = '.snap'
+HEADER = struct.Struct('<8sHH32sIII')
+CHANNEL_RECORD = struct.Struct('<III')
+# start, stop, channel, title, sub_title, desc, category, episode_system, episode, lang
+PROGRAMME_RECORD = struct.Struct('<qqIIIIIIII')
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def snapshot_path(xml_path):
+    return xml_path + SUFFIX
+
+
+def write_snapshot(guide, path, source_hash):
+    """Serializa guide en path (escritura atomica via .tmp)."""
+    strings = StringTable(guide.strings.strings)
+    channel_rows = [(strings.intern(cid), guide.channel_names[i], guide.channel_icons[i])
+                    for i, cid in enumerate(guide.channel_ids)]
+    encoded = [s.encode('utf-8') for s in strings.strings]
+    offsets = array('I', [0])
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    if offsets.itemsize != 4:
+        raise RuntimeError("array('I') no es de 32 bits en esta plataforma")
+    if struct.pack('=I', 1) != struct.pack('<I', 1):
+        offsets.byteswap()
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, source_hash, len(channel_rows), len(encoded), len(guide)))
+        f.write(offsets.tobytes())
+        f.write(b''.join(encoded))
+        for row in channel_rows:
+            f.write(CHANNEL_RECORD.pack(*row))
+        f.write(b'\0' * (-f.tell() % 8))
+        pack = PROGRAMME_RECORD.pack
+        cols = [getattr(guide, name) for name in Guide.COLUMNS]
+        f.write(b''.join(pack(*row) for row in zip(*cols)))
+    os.replace(tmp, path)
+
+
+def read_header(path):
+    """(version, source_hash) del snapshot, o None si no existe o no es valido."""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(raw) < HEADER.size:
+        return None
+    magic, version, _, source_hash, _, _, _ = HEADER.unpack(raw)
+    if magic != MAGIC:
+        return None
+    return version, source_hash
+
+
+def load_snapshot(path):
+    """Reconstruye un Guide desde el snapshot sin parsear XML.
+
+    El archivo se lee via mmap, pero cada columna se copia a un array (y los textos a
+    StringTable): el Guide resultante es mutable y no queda mapeado al archivo.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        magic, version, _, _, n_channels, n_strings, n_programmes = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Snapshot no soportado: {path} (version {version})")
+        pos = HEADER.size
+        offsets = struct.unpack_from(f'<{n_strings + 1}I', buf, pos)
+        pos += 4 * (n_strings + 1)
+        blob = buf[pos:pos + offsets[-1]]
+        pos += offsets[-1]
+        strings = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(n_strings)]
+
+        guide = Guide()
+        guide.strings = StringTable(strings)
+        for k in range(n_channels):
+            id_idx, name_idx, icon_idx = CHANNEL_RECORD.unpack_from(buf, pos + k * CHANNEL_RECORD.size)
+            guide._channel_index[strings[id_idx]] = k
+            guide.channel_ids.append(strings[id_idx])
+            guide.channel_names.append(name_idx)
+            guide.channel_icons.append(icon_idx)
+        pos += n_channels * CHANNEL_RECORD.size
+        pos += -pos % 8
+
+        end = pos + n_programmes * PROGRAMME_RECORD.size
+        if end > len(buf):
+            raise ValueError(f"Snapshot truncado: {path}")
+        if n_programmes:
+            columns = zip(*PROGRAMME_RECORD.iter_unpack(buf[pos:end]))
+            for name, values in zip(Guide.COLUMNS, columns):
+                setattr(guide, name, array(getattr(guide, name).typecode, values))
+    return guide
+
+
+def save_snapshot(guide, xml_path):
+    """Escribe el snapshot de guide junto a xml_path (ya escrito)."""
+    path = snapshot_path(xml_path)
+    write_snapshot(guide, path, file_sha256(xml_path))
+    logger.info(f"Snapshot written: {path} ({len(guide)} programmes)")
+    return path
+
+
+def snapshot_xmltv(xml_path):
+    """Parsea xml_path y deja su snapshot al lado (para writers que no tienen un Guide)."""
+    return save_snapshot(Guide.from_xmltv(xml_path), xml_path)
+
+
+def load_guide(xml_path):
+    """Guide de xml_path: desde el snapshot si esta al dia, si no parsea y lo regenera."""
+    path = snapshot_path(xml_path)
+    source_hash = file_sha256(xml_path)
+    header = read_header(path)
+    if header == (VERSION, source_hash):
+        try:
+            return load_snapshot(path)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            logger.warning(f"Snapshot {path} invalido ({e}) - reparsing XML")
+    guide = Guide.from_xmltv(xml_path)
+    try:
+        write_snapshot(guide, path, source_hash)
+    except OSError as e:
+        logger.warning(f"Could not write snapshot {path}: {e}")
+    return guide
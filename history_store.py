@@ -0,0 +1,308 @@
+"""Historial por canal para guias de catch-up (programas ya emitidos).
+
+Los generadores descartan lo que ya paso y cada corrida pisa el XML anterior.
+Aqui cada canal tiene un log append-only (history/<canal>-<hash>.log) al que
+cada corrida agrega un lote con su programacion; al leer, un lote posterior
+reemplaza lo que los anteriores decian para el mismo rango de tiempo. Asi se
+puede armar una guia de los ultimos CATCHUP_DAYS dias sin volver a pedir nada
+ni guardar copias diarias del XML.
+
+Formato del log (todo little-endian / varints LEB128):
+
+    cabecera   b'EPGHIST1' + <Q tamano tras la ultima compactacion>
+    lote       b'B' + varint(n) + varint(zigzag(start del primero))
+               n registros: varint(zigzag(start - start anterior)) + varint(stop - start)
+                            + 7 strings varint(len)+utf-8: title, sub-title, desc,
+                              categorias (separadas por CATEGORY_SEP), episode system,
+                              episode, lang
+
+La compactacion (cuando el log crece COMPACT_RATIO veces sobre su tamano
+compactado, o con el comando compact) resuelve los lotes, descarta lo que
+termino antes de la ventana de catch-up y reescribe un solo lote atomicamente.
+
+Un log corrupto o truncado (p.ej. un append interrumpido) no corta la corrida:
+se aparta como <archivo>.corrupt y el canal empieza un historial nuevo.
+
+Uso:
+    python history_store.py record epgmvs.xml mlb.xml ...
+    python history_store.py catchup -o catchup.xml [--horas 72] [--canales A,B]
+    python history_store.py compact
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import time
+
+from epg_output import open_output
+from guide_model import CATEGORY_SEP, Guide
+from guide_snapshot import load_guide
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = os.environ.get('HISTORY_DIR', 'history')
+CATCHUP_DAYS = float(os.environ.get('CATCHUP_DAYS', '7'))
+COMPACT_RATIO = float(os.environ.get('HISTORY_COMPACT_RATIO', '3'))
+CHANNELS_FILE = 'channels.json'
+MAGIC = b'EPGHIST1'
+HEADER = struct.Struct('<8sQ')
+BATCH = b'B'
+_FIELDS = 7  # title, sub_title, desc, categories, episode_system, episode, lang
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError(f"Log de historial truncado en byte {pos}")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value // 2 if not value & 1 else -(value + 1) // 2
+
+
+def encode_batch(programmes):
+    """Lote con programmes = [(start, stop, title, sub_title, desc, categories, ep_system, episode, lang)]."""
+    programmes = sorted(programmes)
+    out = [BATCH, _varint(len(programmes)), _varint(_zigzag(programmes[0][0] if programmes else 0))]
+    prev = programmes[0][0] if programmes else 0
+    for prog in programmes:
+        out.append(_varint(_zigzag(prog[0] - prev)))
+        out.append(_varint(max(0, prog[1] - prog[0])))
+        prev = prog[0]
+        for field in prog[2:]:
+            raw = field.encode('utf-8')
+            out.append(_varint(len(raw)))
+            out.append(raw)
+    return b''.join(out)
+
+
+def decode_batches(data, pos=HEADER.size):
+    """Genera la lista de programas de cada lote del log."""
+    while pos < len(data):
+        if data[pos:pos + 1] != BATCH:
+            raise ValueError(f"Log de historial corrupto en byte {pos}")
+        count, pos = _read_varint(data, pos + 1)
+        base, pos = _read_varint(data, pos)
+        start = _unzigzag(base)
+        batch = []
+        for _ in range(count):
+            delta, pos = _read_varint(data, pos)
+            duration, pos = _read_varint(data, pos)
+            start += _unzigzag(delta)
+            fields = []
+            for _ in range(_FIELDS):
+                length, pos = _read_varint(data, pos)
+                if pos + length > len(data):
+                    raise ValueError(f"Log de historial truncado en byte {pos}")
+                fields.append(data[pos:pos + length].decode('utf-8'))
+                pos += length
+            batch.append((start, start + duration, *fields))
+        yield batch
+
+
+def resolve(batches):
+    """Vista final: cada lote manda sobre el rango [primer start, ultimo stop) que cubre."""
+    current = []
+    for batch in batches:
+        if not batch:
+            continue
+        lo, hi = batch[0][0], max(p[1] for p in batch)
+        current = [p for p in current if p[1] <= lo or p[0] >= hi] + batch
+    return sorted(current)
+
+
+def _file_name(channel_id):
+    """Nombre estable y unico para el log de un canal."""
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', channel_id).strip('_') or 'canal'
+    return f"{name}-{hashlib.sha1(channel_id.encode('utf-8')).hexdigest()[:8]}.log"
+
+
+def _programme_tuple(p):
+    ep_system, episode = p.episode or ('', '')
+    return (p.start, p.stop, p.title, p.sub_title, p.desc, CATEGORY_SEP.join(p.categories),
+            ep_system, episode, p.lang)
+
+
+class HistoryStore:
+    """Logs por canal en directory + channels.json (id -> nombre, icono, archivo)."""
+
+    def __init__(self, directory=HISTORY_DIR, catchup_days=CATCHUP_DAYS, compact_ratio=COMPACT_RATIO):
+        self.directory = directory
+        self.window = int(catchup_days * 86400)
+        self.compact_ratio = compact_ratio
+        self.channels = self._load_channels()
+
+    def _load_channels(self):
+        try:
+            with open(os.path.join(self.directory, CHANNELS_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_channels(self):
+        with open_output(os.path.join(self.directory, CHANNELS_FILE), formats=()) as f:
+            f.write(json.dumps(self.channels, indent=1, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+
+    def _path(self, channel_id):
+        return os.path.join(self.directory, _file_name(channel_id))
+
+    def _read(self, channel_id):
+        """(bytes del log, tamano compactado); log vacio si no existe o si la cabecera es invalida."""
+        try:
+            with open(self._path(channel_id), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return b'', 0
+        try:
+            magic, compacted = HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError(f"{self._path(channel_id)} no es un log de historial")
+        except (struct.error, ValueError) as e:  # struct.error: menos de HEADER.size bytes
+            self._discard(channel_id, e)
+            return b'', 0
+        return data, compacted
+
+    def _load(self, channel_id):
+        """(programas resueltos, bytes del log, tamano compactado); un log ilegible cuenta como vacio."""
+        data, compacted = self._read(channel_id)
+        if not data:
+            return [], b'', 0
+        try:
+            return resolve(decode_batches(data)), data, compacted
+        except ValueError as e:  # Incluye UnicodeDecodeError
+            self._discard(channel_id, e)
+            return [], b'', 0
+
+    def _discard(self, channel_id, error):
+        """Aparta un log corrupto (.corrupt) para que el proximo append arranque uno nuevo."""
+        path = self._path(channel_id)
+        logger.error(f"History {channel_id}: unreadable log ({error}) - moved to {path}.corrupt, starting over")
+        os.replace(path, path + '.corrupt')
+
+    def programmes(self, channel_id, since=None, until=None):
+        """Programas resueltos del canal que se solapan con [since, until)."""
+        progs, _, _ = self._load(channel_id)
+        return [p for p in progs if (since is None or p[1] > since) and (until is None or p[0] < until)]
+
+    def append(self, channel_id, programmes, now=None):
+        """Agrega un lote si cambia algo en su rango; compacta si el log crecio. Retorna True si escribio."""
+        if not programmes:
+            return False
+        programmes = sorted(programmes)
+        current, data, compacted = self._load(channel_id)
+        if data:
+            lo, hi = programmes[0][0], max(p[1] for p in programmes)
+            if [p for p in current if p[0] < hi and p[1] > lo] == programmes:
+                return False  # Misma programacion que ya tenemos
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(channel_id), 'ab') as f:
+            if not data:
+                f.write(HEADER.pack(MAGIC, 0))
+            f.write(encode_batch(programmes))
+            size = f.tell()
+        if size > max(compacted, 4096) * self.compact_ratio:
+            self.compact(channel_id, now)
+        return True
+
+    def compact(self, channel_id, now=None):
+        """Reescribe el log con un solo lote, sin lo que quedo fuera de la ventana."""
+        now = int(now if now is not None else time.time())
+        current, data, _ = self._load(channel_id)
+        if not data:
+            return
+        progs = [p for p in current if p[1] > now - self.window]
+        batch = encode_batch(progs) if progs else b''
+        path = self._path(channel_id)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, HEADER.size + len(batch)))
+            f.write(batch)
+        os.replace(tmp, path)
+        logger.info(f"History {channel_id}: compacted {len(data)} -> {HEADER.size + len(batch)} bytes "
+                    f"({len(progs)} programmes)")
+
+    def compact_all(self, now=None):
+        for channel_id in self.channels:
+            self.compact(channel_id, now)
+
+    def record_guide(self, guide, now=None):
+        """Agrega la programacion de cada canal de guide; retorna cuantos canales cambiaron."""
+        changed = 0
+        for idx, cid in enumerate(guide.channel_ids):
+            self.channels[cid] = {'name': guide.strings[guide.channel_names[idx]],
+                                  'icon': guide.strings[guide.channel_icons[idx]],
+                                  'file': _file_name(cid)}
+            rows = guide.rows_for(cid)
+            if self.append(cid, [_programme_tuple(guide[i]) for i in rows], now):
+                changed += 1
+        self._save_channels()
+        return changed
+
+    def catchup_guide(self, hours=None, channel_ids=None, now=None):
+        """Guide con lo emitido en las ultimas hours horas (default: toda la ventana)."""
+        now = int(now if now is not None else time.time())
+        since = now - (int(hours * 3600) if hours else self.window)
+        guide = Guide()
+        for cid in channel_ids or sorted(self.channels):
+            info = self.channels.get(cid, {})
+            guide.add_channel(cid, info.get('name', ''), info.get('icon', ''))
+            for p in self.programmes(cid, since, now):
+                guide.add_programme(cid, p[0], p[1], p[2], p[3], p[4],
+                                    p[5].split(CATEGORY_SEP) if p[5] else (),
+                                    (p[6], p[7]) if p[7] else None, p[8])
+        return guide
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Historial por canal para guias de catch-up.")
+    parser.add_argument('--dir', default=HISTORY_DIR, help=f"Directorio del historial (default {HISTORY_DIR})")
+    parser.add_argument('--dias', type=float, default=CATCHUP_DAYS, help="Ventana de catch-up en dias")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    rec = sub.add_parser('record', help="Agrega la programacion de las guias al historial")
+    rec.add_argument('guias', nargs='+')
+    cat = sub.add_parser('catchup', help="Escribe un XMLTV con lo ya emitido")
+    cat.add_argument('-o', '--salida', default='catchup.xml')
+    cat.add_argument('--horas', type=float, default=None, help="Horas hacia atras (default: toda la ventana)")
+    cat.add_argument('--canales', default=None, help="IDs separados por coma (default: todos)")
+    sub.add_parser('compact', help="Compacta todos los logs")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.dir, args.dias)
+    if args.comando == 'record':
+        for path in args.guias:
+            logger.info(f"{path}: {store.record_guide(load_guide(path))} channels updated in history")
+    elif args.comando == 'catchup':
+        channel_ids = [c.strip() for c in args.canales.split(',')] if args.canales else None
+        guide = store.catchup_guide(args.horas, channel_ids)
+        with open_output(args.salida) as f:
+            guide.write_xmltv(f, {"generator-info-name": "xmldata catch-up"})
+        logger.info(f"Catch-up guide written to {args.salida}: {len(guide)} programmes")
+    else:
+        store.compact_all()
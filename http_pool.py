@@ -0,0 +1,216 @@
+"""Cliente HTTP compartido: un pool keep-alive por host:port y un solo cookie jar.
+
+PooledSession es un requests.Session normal (session.get, session.cookies, ...)
+con un HTTPAdapter propio por cada host:port declarado, dimensionado segun
+cuantas conexiones en paralelo usa cada fase. Asi el handshake TLS se paga una
+vez por host por corrida y las cookies (JSESSIONID, AWSALB...) siguen vivas
+entre token, customer, account y EPG.
+
+Con adaptive=AdaptiveLimits(...) cada host declarado tiene ademas un limite de
+requests en vuelo que se ajusta solo (AIMD, como la ventana de TCP): sube de a
+uno por "ronda" de respuestas sanas y se corta a la mitad ante 406/429/5xx,
+errores de conexion o una latencia muy por encima de la habitual. Un 429 con
+Retry-After pausa el host. El limite y la latencia de cada host se guardan en
+HTTP_STATE_FILE, asi la corrida siguiente arranca donde quedo la anterior y no
+desde 1.
+"""
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from epg_output import write_if_changed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_MAXSIZE = 4
+HTTP_STATE_FILE = os.environ.get('HTTP_STATE_FILE', 'http_state.json')
+BACKOFF_STATUSES = {406, 429}  # Ademas de todos los 5xx
+LATENCY_FACTOR = float(os.environ.get('HTTP_LATENCY_FACTOR', '3'))  # x latencia habitual = congestion
+MAX_RETRY_AFTER = 60
+
+
+def origin_of(url):
+    """'https://host:port' de una URL (el puerto por defecto queda implicito)."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _retry_after(value):
+    """Segundos de un header Retry-After (segundos o fecha HTTP); 1 si no se entiende."""
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class AimdLimiter:
+    """Limite adaptativo de requests en vuelo para un host (thread-safe)."""
+
+    def __init__(self, limit=1.0, max_limit=DEFAULT_POOL_MAXSIZE, min_limit=1.0, increase=1.0, decrease=0.5,
+                 latency=None, latency_factor=LATENCY_FACTOR):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = min(self.max_limit, max(min_limit, limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency = latency  # EWMA en segundos de las respuestas sin error
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_backoff = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            self.in_flight += 1
+
+    def release(self, status, elapsed, retry_after=None):
+        """Registra el resultado de un request: status None = error de conexion/timeout."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            slow = self.latency is not None and elapsed > self.latency * self.latency_factor
+            if status is None or status in BACKOFF_STATUSES or status >= 500 or slow:
+                # Un solo recorte por ronda: los requests que ya estaban en vuelo no vuelven a cortar
+                if now - self._last_backoff > (self.latency or 1.0):
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_backoff = now
+                    logger.info(f"AIMD backoff ({status or 'error'}{', slow' if slow else ''}): "
+                                f"limit {self.limit:.2f}")
+                if status == 429:
+                    self.paused_until = max(self.paused_until, now + _retry_after(retry_after))
+            elif status < 400:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            if status is not None and status < 500 and status not in BACKOFF_STATUSES:
+                self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            self._cond.notify_all()
+
+    def state(self):
+        return {'limit': round(self.limit, 3),
+                'latency_ms': None if self.latency is None else round(self.latency * 1000, 1)}
+
+
+class AdaptiveLimits:
+    """AimdLimiter por origen + su estado entre corridas (path=None: solo en memoria)."""
+
+    def __init__(self, path=HTTP_STATE_FILE):
+        self.path = path
+        self.limiters = {}
+        self.saved = self._load()
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def limiter(self, origin, max_limit):
+        """Limitador de origin; arranca con el limite y la latencia guardados."""
+        if origin not in self.limiters:
+            saved = self.saved.get(origin, {})
+            latency_ms = saved.get('latency_ms')
+            self.limiters[origin] = AimdLimiter(saved.get('limit', 1.0), max_limit,
+                                                latency=latency_ms / 1000 if latency_ms else None)
+            logger.info(f"AIMD {origin}: starting at limit {self.limiters[origin].limit:.2f} (max {max_limit})")
+        return self.limiters[origin]
+
+    def get(self, origin):
+        return self.limiters.get(origin)
+
+    def save(self):
+        self.saved.update({origin: lim.state() for origin, lim in self.limiters.items()})
+        if self.path:
+            data = json.dumps(self.saved, indent=1, sort_keys=True).encode('utf-8')
+            write_if_changed(self.path, data, formats=())
+
+
+class PooledSession(requests.Session):
+    """Session con pools por origen. hosts: {'https://host:port': conexiones_max}.
+
+    adaptive: AdaptiveLimits opcional; limita los requests en vuelo de cada host declarado.
+    """
+
+    def __init__(self, hosts=None, verify=True, default_pool_maxsize=DEFAULT_POOL_MAXSIZE, adaptive=None):
+        super().__init__()
+        self.verify = verify
+        self.adaptive = adaptive
+        self._owns_adapters = True
+        self.headers['Connection'] = 'keep-alive'
+        # Fallback para cualquier otro host
+        default = HTTPAdapter(pool_connections=4, pool_maxsize=default_pool_maxsize)
+        self.mount('https://', default)
+        self.mount('http://', default)
+        for origin, maxsize in (hosts or {}).items():
+            self.add_host(origin, maxsize)
+
+    def add_host(self, origin, pool_maxsize):
+        """Registra un pool dedicado para origin ('https://host:port')."""
+        # pool_block=False: si se excede, abre conexiones extra en vez de bloquear
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=False)
+        self.mount(origin.rstrip('/') + '/', adapter)
+        if self.adaptive is not None:
+            self.adaptive.limiter(origin.rstrip('/'), pool_maxsize)
+        return adapter
+
+    def send(self, request, **kwargs):
+        limiter = self.adaptive.get(origin_of(request.url)) if self.adaptive is not None else None
+        if limiter is None:
+            return super().send(request, **kwargs)
+        limiter.acquire()
+        started = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            limiter.release(None, time.monotonic() - started)
+            raise
+        limiter.release(response.status_code, time.monotonic() - started, response.headers.get('Retry-After'))
+        return response
+
+    def save_state(self):
+        """Guarda el estado AIMD de los hosts (si la session es adaptativa)."""
+        if self.adaptive is not None:
+            self.adaptive.save()
+
+    def fork(self, cookies=None, domain=''):
+        """Session con los mismos pools (y limites AIMD) pero un cookie jar propio.
+
+        Para requests que no deben mandar ni recibir las cookies de esta session
+        (p.ej. un fallback con otra sesion del upstream). Los pools siguen siendo de
+        la session original: cerrar el fork no cierra conexiones.
+        """
+        other = PooledSession(verify=self.verify, adaptive=self.adaptive)
+        other.adapters = self.adapters.copy()
+        other._owns_adapters = False
+        other.headers = self.headers.copy()
+        other.set_cookies(cookies, domain=domain)
+        return other
+
+    def close(self):
+        self.save_state()
+        if self._owns_adapters:
+            super().close()
+
+    def set_cookies(self, cookies, domain='', overwrite=True):
+        """Carga un dict de cookies en el jar compartido."""
+        for name, value in (cookies or {}).items():
+            if overwrite or name not in self.cookies:
+                self.cookies.set(name, value, domain=domain)
@@ -0,0 +1,254 @@
+"""Espejo local de logos de canal, direccionado por contenido.
+
+Descarga en paralelo los <icon src> de las guias (schedulesdirect S3,
+images.open-epg.com, ...) con requests condicionales (ETag/Last-Modified), los
+guarda como <sha256>.<ext> para que imagenes repetidas compartan un solo
+archivo, opcionalmente los reduce a LOGO_MAX_SIZE px (requiere Pillow) y
+reescribe cada <icon src> apuntando al espejo. Los clientes bajan todos los
+logos de un solo origen en vez de varios hosts externos.
+
+logos/index.json guarda url -> archivo + validadores; si una descarga falla se
+conserva la URL original en la guia. Las guias se reescriben sin .gz/.xz: se
+comprimen despues con epg_output.py, una sola vez por corrida.
+
+Env:
+    LOGO_DIR        directorio del espejo (default logos)
+    LOGO_BASE_URL   prefijo publico de LOGO_DIR en las guias reescritas
+    LOGO_MAX_SIZE   lado maximo en px (0 = sin reducir)
+    LOGO_WORKERS    descargas en paralelo (default 8)
+
+Uso: python logo_mirror.py guia_filtrada.xml guiamix.xml [--prune]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import argparse
+import hashlib
+import html
+import io
+import json
+import logging
+import os
+import re
+import threading
+
+from epg_output import write_if_changed
+from guide_snapshot import snapshot_xmltv
+from http_pool import PooledSession
+
+logger = logging.getLogger(__name__)
+
+LOGO_DIR = os.environ.get('LOGO_DIR', 'logos')
+LOGO_BASE_URL = os.environ.get('LOGO_BASE_URL', 'https://raw.githubusercontent.com/Dingolobo/xmldata/main/logos/')
+LOGO_MAX_SIZE = int(os.environ.get('LOGO_MAX_SIZE', '0'))
+LOGO_WORKERS = int(os.environ.get('LOGO_WORKERS', '8'))
+INDEX_NAME = 'index.json'
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/88.0.4324.96 Safari/537.36")
+
+_RE_ICON = re.compile(rb'<icon\b[^>]*>')
+_RE_ATTR = {name: re.compile(rb'(\s' + name + rb'=)(["\'])(.*?)\2', re.DOTALL)
+            for name in (b'src', b'width', b'height')}
+_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/svg+xml': '.svg',
+}
+
+
+def icon_urls(xml_bytes):
+    """URLs (sin escapar) de todos los <icon src> del XML, en orden y sin repetir."""
+    urls = {}
+    for m in _RE_ICON.finditer(xml_bytes):
+        src = _RE_ATTR[b'src'].search(m.group(0))
+        if src:
+            url = html.unescape(src.group(3).decode('utf-8'))
+            if url.startswith(('http://', 'https://')):
+                urls[url] = None
+    return list(urls)
+
+
+def _extension(url, content_type):
+    ext = _EXTENSIONS.get((content_type or '').split(';')[0].strip().lower())
+    if ext:
+        return ext
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if ext in _EXTENSIONS.values() else '.img'
+
+
+def downsize(data, max_size):
+    """(bytes, ancho, alto) reducidos a max_size de lado; sin Pillow o si no aplica, los originales."""
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow not installed - LOGO_MAX_SIZE ignored")
+        return data, None, None
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+        if max(img.size) <= max_size:
+            return data, img.size[0], img.size[1]
+        img.thumbnail((max_size, max_size))
+        out = io.BytesIO()
+        img.save(out, format=fmt, optimize=True)
+        return out.getvalue(), img.size[0], img.size[1]
+    except Exception as e:  # SVG u otro formato que Pillow no abre
+        logger.info(f"Cannot downsize image ({e}) - keeping original")
+        return data, None, None
+
+
+class LogoMirror:
+    """Indice url -> archivo local; descarga, deduplica y reescribe guias."""
+
+    def __init__(self, directory=LOGO_DIR, base_url=LOGO_BASE_URL, max_size=LOGO_MAX_SIZE,
+                 workers=LOGO_WORKERS, session=None):
+        self.directory = directory
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.max_size = max_size
+        self.workers = workers
+        self.session = session
+        self.index = self._load_index()
+        self._write_lock = threading.Lock()  # Dos URLs con la misma imagen escriben el mismo archivo
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        data = json.dumps(self.index, indent=1, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        write_if_changed(os.path.join(self.directory, INDEX_NAME), data, formats=())
+
+    def _fetch(self, url):
+        """Descarga (condicional) una URL; retorna (url, entrada nueva o None si no cambio)."""
+        entry = self.index.get(url)
+        headers = {}
+        if entry and os.path.exists(os.path.join(self.directory, entry['file'])):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        resp = self.session.get(url, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            return url, None
+        resp.raise_for_status()
+        data, width, height = resp.content, None, None
+        if self.max_size:
+            data, width, height = downsize(data, self.max_size)
+        name = hashlib.sha256(data).hexdigest()[:32] + _extension(url, resp.headers.get('Content-Type'))
+        path = os.path.join(self.directory, name)
+        with self._write_lock:
+            if not os.path.exists(path):  # Mismo contenido = mismo archivo
+                write_if_changed(path, data, formats=())
+        new_entry = {'file': name, 'etag': resp.headers.get('ETag', ''),
+                     'last_modified': resp.headers.get('Last-Modified', '')}
+        if width and height:
+            new_entry.update(width=width, height=height)
+        return url, new_entry
+
+    def update(self, urls):
+        """Descarga en paralelo las URLs; retorna cuantas cambiaron."""
+        os.makedirs(self.directory, exist_ok=True)
+        own_session = self.session is None
+        if own_session:
+            self.session = PooledSession(default_pool_maxsize=self.workers)
+            self.session.headers['User-Agent'] = USER_AGENT
+        changed = failed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self._fetch, url): url for url in urls}
+                for future, url in futures.items():
+                    try:
+                        _, entry = future.result()
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"Logo {url} failed: {e}")
+                        continue
+                    if entry is not None:
+                        self.index[url] = entry
+                        changed += 1
+        finally:
+            if own_session:
+                self.session.close()
+                self.session = None
+        self.save_index()
+        logger.info(f"Logos: {len(urls)} urls, {changed} downloaded, {len(urls) - changed - failed} not modified, "
+                    f"{failed} failed, {len({e['file'] for e in self.index.values()})} files")
+        return changed
+
+    def local_url(self, url):
+        entry = self.index.get(url)
+        if entry and os.path.exists(os.path.join(self.directory, entry['file'])):
+            return self.base_url + entry['file']
+        return None
+
+    def rewrite(self, xml_bytes):
+        """XML con cada <icon src> del espejo apuntando a la copia local (y width/height si se redujo)."""
+        def replace_icon(m):
+            tag = m.group(0)
+            src = _RE_ATTR[b'src'].search(tag)
+            if not src:
+                return tag
+            url = html.unescape(src.group(3).decode('utf-8'))
+            local = self.local_url(url)
+            if local is None:
+                return tag
+            entry = self.index[url]
+            values = {b'src': html.escape(local).encode('utf-8')}
+            if entry.get('width'):
+                values[b'width'] = str(entry['width']).encode()
+                values[b'height'] = str(entry['height']).encode()
+            for name, value in values.items():
+                tag = _RE_ATTR[name].sub(lambda a: a.group(1) + a.group(2) + value + a.group(2), tag, count=1)
+            return tag
+        return _RE_ICON.sub(replace_icon, xml_bytes)
+
+    def prune(self, keep_urls, keep_files=()):
+        """Olvida URLs que ya no aparecen y borra archivos sin referencia."""
+        keep_urls, keep_files = set(keep_urls), set(keep_files)
+        self.index = {u: e for u, e in self.index.items() if u in keep_urls or e['file'] in keep_files}
+        referenced = {e['file'] for e in self.index.values()} | {INDEX_NAME}
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name not in referenced:
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+        self.save_index()
+        logger.info(f"Logos: pruned {removed} unreferenced files")
+
+
+def mirror_guides(xml_paths, mirror=None, prune=False):
+    """Actualiza el espejo con los logos de xml_paths y reescribe cada guia si cambia."""
+    mirror = mirror or LogoMirror()
+    guides = {}
+    for path in xml_paths:
+        with open(path, 'rb') as f:
+            guides[path] = f.read()
+    found = list(dict.fromkeys(u for data in guides.values() for u in icon_urls(data)))
+    # Guias ya reescritas en una corrida anterior apuntan al espejo: no se descargan
+    urls = [u for u in found if not u.startswith(mirror.base_url)]
+    mirror.update(urls)
+    if prune:
+        mirror.prune(urls, [u[len(mirror.base_url):] for u in found if u.startswith(mirror.base_url)])
+    for path, data in guides.items():
+        if write_if_changed(path, mirror.rewrite(data), formats=()):
+            snapshot_xmltv(path)
+            logger.info(f"{path}: icons rewritten to {mirror.base_url}")
+    return mirror
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Espeja los logos de las guias y reescribe <icon src>.")
+    parser.add_argument('guias', nargs='+')
+    parser.add_argument('--dir', default=LOGO_DIR, help=f"Directorio del espejo (default {LOGO_DIR})")
+    parser.add_argument('--base-url', default=LOGO_BASE_URL, help="URL publica de --dir")
+    parser.add_argument('--max-size', type=int, default=LOGO_MAX_SIZE, help="Lado maximo en px (0 = original)")
+    parser.add_argument('--workers', type=int, default=LOGO_WORKERS)
+    parser.add_argument('--prune', action='store_true', help="Borra logos que ya no usa ninguna guia")
+    args = parser.parse_args()
+    mirror_guides(args.guias, LogoMirror(args.dir, args.base_url, args.max_size, args.workers), prune=args.prune)
@@ -18,6 +18,10 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException
 
+from epg_output import open_output
+from epg_shards import write_shards
+from guide_snapshot import snapshot_xmltv
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -28,6 +32,8 @@ UUID = "a8e7b76a-818e-4830-a518-a83debab41ce"  # Fallback viejo
 URL_BASE = f"https://edge.prod.ovp.ses.com:9443/xtv-ws-client/api/epgcache/list/{UUID}/" + "{}/220?page=0&size=100&dateFrom={}&dateTo={}"
 LINEUP_ID = "220"
 OUTPUT_FILE = "epgmvs.xml"
+SHARDS_DIR = os.environ.get('SHARDS_DIR', '')  # Opcional: fragmentos por canal/dia + manifest
+SHARDS_BY = os.environ.get('SHARDS_BY', 'channel')
 SITE_URL = "https://www.mvshub.com.mx/#spa/epg"
 
 # Headers para EPG API
@@ -317,7 +323,11 @@ def build_xmltv(channels_data):
     reparsed = ET.fromstring(rough_string)
     ET.indent(reparsed, space="  ", level=0)
     tree = ET.ElementTree(reparsed)
-    tree.write(OUTPUT_FILE, encoding="utf-8", xml_declaration=True)
+    with open_output(OUTPUT_FILE) as f_out:  # + .xml.gz/.xml.xz
+        tree.write(f_out, encoding="utf-8", xml_declaration=True)
+    snapshot_xmltv(OUTPUT_FILE)
+    if SHARDS_DIR:
+        write_shards(OUTPUT_FILE, SHARDS_DIR, by=SHARDS_BY)
     
     num_channels = len(channels)
     total_programmes = sum(len(contents) for _, contents in channels_data if contents)
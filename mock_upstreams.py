@@ -0,0 +1,215 @@
+"""Servidores falsos de tvtv y mvshub para medir la capa de fetch sin salir a la red.
+
+Imitan las rutas que usan los generadores:
+
+    GET /api/v1/lineup/<lineup>/grid/<desde>/<hasta>/<canales>     (generate_epg.py)
+    GET /xtv-ws-client/api/login/cache/token                       (mvshub)
+    GET /xtv-ws-client/api/v1/customer
+    GET /xtv-ws-client/api/v1/account
+    GET /xtv-ws-client/api/epgcache/list/<uuid>/<canal>/<lineup>
+    GET /__stats                                                   contadores en JSON
+
+MockConfig controla latencia (media + jitter), probabilidad de error por codigo
+(406/429/5xx) y tamano de las respuestas (programas por canal y largo de desc).
+Con la misma seed, la secuencia de errores es reproducible.
+
+Uso: python mock_upstreams.py [--port 8800] [--latency-ms 80] [--errors 406:0.05,503:0.02]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+import argparse
+import calendar
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TVTV_GRID_PREFIX = '/api/v1/lineup/'
+MVS_PREFIX = '/xtv-ws-client/api'
+
+
+def parse_errors(spec):
+    """'406:0.05,503:0.02' -> {406: 0.05, 503: 0.02}"""
+    errors = {}
+    for part in (p.strip() for p in (spec or '').split(',')):
+        if part:
+            code, _, rate = part.partition(':')
+            errors[int(code)] = float(rate)
+    return errors
+
+
+class MockConfig:
+    """Parametros de los mocks; se pueden cambiar entre corridas del benchmark."""
+
+    def __init__(self, latency_ms=50.0, jitter_ms=10.0, errors=None, programmes=48, desc_chars=200,
+                 seed=1234):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.errors = dict(errors or {})
+        self.programmes = programmes
+        self.desc_chars = desc_chars
+        self.seed = seed
+
+    def as_dict(self):
+        return {'latency_ms': self.latency_ms, 'jitter_ms': self.jitter_ms,
+                'errors': {str(k): v for k, v in self.errors.items()},
+                'programmes': self.programmes, 'desc_chars': self.desc_chars, 'seed': self.seed}
+
+
+class MockStats:
+    """Requests y bytes por endpoint y por status (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.statuses = {}
+            self.bytes_sent = 0
+
+    def record(self, endpoint, status, size):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.bytes_sent += size
+
+    def snapshot(self):
+        with self._lock:
+            return {'requests': dict(self.requests), 'total_requests': sum(self.requests.values()),
+                    'statuses': dict(self.statuses), 'bytes_sent': self.bytes_sent}
+
+
+def tvtv_grid(channels, start_iso, programmes, desc_chars):
+    """Array de arrays (uno por canal) con el formato de la API de tvtv."""
+    start = calendar.timegm(time.strptime(start_iso[:19], '%Y-%m-%dT%H:%M:%S'))
+    runtime = max(1, 24 * 60 // max(1, programmes))
+    grid = []
+    for ch in channels:
+        progs = []
+        for i in range(programmes):
+            t = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(start + i * runtime * 60))
+            progs.append({'startTime': t, 'runTime': runtime, 'duration': runtime * 60,
+                          'title': f"MLB Game {ch}-{i}", 'subtitle': ('x' * desc_chars) if i % 2 else '',
+                          'type': 'O' if i % 3 else 'L', 'flags': ['CC'] if i % 2 else ['Live']})
+        grid.append(progs)
+    return grid
+
+
+def mvs_events(channel, programmes, desc_chars, now_ms):
+    """Eventos de epgcache/list: uno cada 7 dias / programmes, desde ahora."""
+    step = 7 * 24 * 3600 * 1000 // max(1, programmes)
+    return [{'startDateTime': now_ms + i * step, 'endDateTime': now_ms + (i + 1) * step,
+             'title': f"Programa {channel}-{i}", 'description': 'd' * desc_chars,
+             'genre': 'Noticias, Actualidad', 'seasonNumber': i % 4 - 1}
+            for i in range(programmes)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config = None  # MockConfig, asignado en start_mock()
+    stats = None
+    rng = None
+    rng_lock = threading.Lock()
+    protocol_version = 'HTTP/1.1'  # keep-alive, como los upstreams reales
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s - %s", self.address_string(), fmt % args)
+
+    def _roll(self):
+        """(latencia en segundos, status de error o None) sorteados con la seed del config."""
+        cfg = self.config
+        with self.rng_lock:
+            delay = max(0.0, self.rng.gauss(cfg.latency_ms, cfg.jitter_ms)) / 1000
+            r = self.rng.random()
+        acc = 0.0
+        for code, rate in sorted(cfg.errors.items()):
+            acc += rate
+            if r < acc:
+                return delay, code
+        return delay, None
+
+    def _send(self, endpoint, status, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+        if endpoint:
+            self.stats.record(endpoint, status, len(body))
+
+    def do_GET(self):
+        path = unquote(urlsplit(self.path).path)
+        if path == '/__stats':
+            self._send(None, 200, self.stats.snapshot())
+            return
+        cfg = self.config
+        if path.startswith(TVTV_GRID_PREFIX) and '/grid/' in path:
+            endpoint = 'tvtv/grid'
+        elif path.startswith(MVS_PREFIX + '/epgcache/list/'):
+            endpoint = 'mvs/epgcache'
+        elif path in (MVS_PREFIX + '/login/cache/token', MVS_PREFIX + '/v1/customer', MVS_PREFIX + '/v1/account'):
+            endpoint = 'mvs/' + path.rsplit('/', 1)[-1]
+        else:
+            self._send('unknown', 404, {'error': 'not found'})
+            return
+
+        delay, error = self._roll()
+        time.sleep(delay)
+        if error:
+            self._send(endpoint, error, {'error': f"mock {error}"})
+            return
+
+        if endpoint == 'tvtv/grid':
+            parts = path[len(TVTV_GRID_PREFIX):].split('/')  # lineup, 'grid', desde, hasta, canales
+            channels = [c for c in parts[4].split(',') if c] if len(parts) > 4 else []
+            self._send(endpoint, 200, tvtv_grid(channels, parts[2], cfg.programmes, cfg.desc_chars))
+        elif endpoint == 'mvs/epgcache':
+            channel = path.rstrip('/').split('/')[-2]
+            now_ms = int(time.time() * 1000)
+            self._send(endpoint, 200, {'contents': {'content': mvs_events(channel, cfg.programmes,
+                                                                          cfg.desc_chars, now_ms)}})
+        elif endpoint == 'mvs/token':
+            self._send(endpoint, 200, {'token': {'uuid': 'mock-uuid-0000', 'cacheUrl': ''}})
+        elif endpoint == 'mvs/customer':
+            self._send(endpoint, 200, {'id': 1, 'mainAccountId': '7035', 'subscribedServices': [{'name': 'EPG'}]})
+        else:
+            self._send(endpoint, 200, [{'accountId': '7035'}])
+
+
+def start_mock(config=None, host='127.0.0.1', port=0):
+    """Levanta los mocks en un hilo; retorna (server, 'http://host:port', stats)."""
+    config = config or MockConfig()
+    stats = MockStats()
+    handler = type('BoundMockHandler', (MockHandler,), {'config': config, 'stats': stats,
+                                                         'rng': random.Random(config.seed)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mock-upstreams', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Mocks locales de tvtv y mvshub.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--errors', default='', help="Probabilidad por status, p.ej. 406:0.05,429:0.02,503:0.01")
+    parser.add_argument('--programmes', type=int, default=48, help="Programas por canal en cada respuesta")
+    parser.add_argument('--desc-chars', type=int, default=200)
+    args = parser.parse_args()
+    cfg = MockConfig(args.latency_ms, args.jitter_ms, parse_errors(args.errors), args.programmes, args.desc_chars)
+    server, base, _ = start_mock(cfg, args.host, args.port)
+    logger.info(f"Mock upstreams on {base} ({cfg.as_dict()})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
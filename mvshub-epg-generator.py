@@ -1,23 +1,32 @@
 #!/usr/bin/env python3
-import requests
+import time
+_STARTUP = [('interpreter', time.perf_counter())]  # Checkpoints para --profile-startup
 import xml.etree.ElementTree as ET
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 import sys
 import os
 import logging
-import time
 import json
 import re
 import base64  # Para decode JWT
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.common.exceptions import TimeoutException, WebDriverException
+_STARTUP.append(('stdlib', time.perf_counter()))
+# selenium/webdriver_manager se importan dentro de get_session_via_selenium (solo si USE_SELENIUM)
+import requests
 import urllib3  # Para suprimir warnings
+_STARTUP.append(('requests', time.perf_counter()))
+
+from driver_cache import chromedriver_path, invalidate as invalidate_driver_cache
+from epg_output import open_output
+from epg_pipeline import PIPELINE_DEPTH, bounded_pipeline
+from guide_model import Guide, GuideWriter
+from guide_snapshot import load_guide, snapshot_xmltv
+from http_pool import HTTP_STATE_FILE, AdaptiveLimits, PooledSession, origin_of
+from run_budget import RunBudget, order_by_priority, parse_priorities
+from epg_shards import write_shards
+_STARTUP.append(('local modules', time.perf_counter()))
 
 # Suprimir warnings de HTTPS no verificado
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -28,13 +37,34 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 CHANNEL_IDS = [967]  # Cambia a [222, 807] para tus canales
+# Prioridad por canal ("967:10,222:5"): mayor se pide primero; el resto queda en 0
+CHANNEL_PRIORITIES = parse_priorities(os.environ.get('CHANNEL_PRIORITIES', ''))
+# Deadline global de la corrida en segundos (sin definir o 0 = sin límite; el workflow usa 600);
+# se reservan unos segundos para escribir el XML
+RUN_DEADLINE = float(os.environ.get('RUN_DEADLINE') or 0) or None
+RUN_BUDGET = RunBudget(RUN_DEADLINE, reserve=10)
 LINEUP_ID = "220"
 OUTPUT_FILE = "epgmvs.xml"
+# Varios lineups/regiones en una corrida: "220:18=967,222;221:19=967,807" (canales vacíos = CHANNEL_IDS).
+# Comparten Selenium, token y pools; un canal presente en varios lineups se pide una sola vez.
+# El primero escribe OUTPUT_FILE, el resto epgmvs_<lineup>_<region>.xml. Vacío = LINEUP_ID + región de init
+MVS_LINEUPS = os.environ.get('MVS_LINEUPS', '')
+SHARDS_DIR = os.environ.get('SHARDS_DIR', '')  # Opcional: fragmentos por canal/dia + manifest
+SHARDS_BY = os.environ.get('SHARDS_BY', 'channel')
 SITE_URL = "https://www.mvshub.com.mx/#spa/epg"
 TOKEN_URL = "https://edge.prod.ovp.ses.com:4447/xtv-ws-client/api/login/cache/token"
 CUSTOMER_URL = "https://edge.prod.ovp.ses.com:4447/xtv-ws-client/api/v1/customer"
 ACCOUNT_URL = "https://edge.prod.ovp.ses.com:4447/xtv-ws-client/api/v1/account"
 EPG_BASE_URL = "https://edge.prod.ovp.ses.com:9443/xtv-ws-client/api/epgcache/list"
+COOKIE_DOMAIN = '.prod.ovp.ses.com'
+
+# Un pool keep-alive por host:port (4447 = auth, 9443 = EPG), compartido por toda la corrida.
+# El valor es tambien el techo de requests en vuelo del control AIMD de http_pool.
+HOST_POOLS = {
+    "https://edge.prod.ovp.ses.com:4447": 2,
+    "https://edge.prod.ovp.ses.com:9443": 4,
+}
+HTTP_STATE = HTTP_STATE_FILE  # Limite/latencia por host entre corridas (None = sin persistir)
 
 # Headers para API (exactos de DevTools)
 API_HEADERS = {
@@ -115,10 +145,20 @@ def decode_jwt(jwt, account_id=None, region_id='18'):
 
 def get_session_via_selenium():
     """Selenium: Extrae cookies + JWT, fetch settings.json para deviceToken fresco."""
+    global FALLBACK_JWT, FALLBACK_UUID
     if not os.environ.get('USE_SELENIUM', 'true').lower() == 'true':
         logger.info("Selenium disabled - fallback")
         return FALLBACK_COOKIES, FALLBACK_JWT
 
+    # Imports pesados solo en este camino
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+
     debug_mode = os.environ.get('DEBUG_SELENIUM', 'false').lower() == 'true'
     logger.info(f"Using Selenium... Debug: {debug_mode}")
     options = Options()
@@ -129,14 +169,19 @@ def get_session_via_selenium():
     options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36")
     options.add_argument("--disable-blink-features=AutomationControlled")
 
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=options)
+    # Driver cacheado/fijado (sin red si ya está); si no arranca (Chrome actualizado), se re-descarga una vez
+    try:
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+    except WebDriverException as e:
+        logger.warning(f"Cached chromedriver failed ({str(e).splitlines()[0]}) - refreshing cache")
+        invalidate_driver_cache()
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=options)
 
     try:
         driver.get(SITE_URL)
-        wait = WebDriverWait(driver, 20)
+        wait = WebDriverWait(driver, RUN_BUDGET.timeout(20))
         wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-        time.sleep(5)
+        RUN_BUDGET.sleep(5)
 
         # Fetch settings.json para deviceToken fresco
         timestamp = int(time.time() * 1000)
@@ -148,12 +193,11 @@ def get_session_via_selenium():
             device_token = settings_data.get('anonymous-browsing', {}).get('deviceToken')
             if device_token:
                 logger.info(f"DeviceToken from settings.json: {device_token[:20]}... (length: {len(device_token)})")
-                global FALLBACK_JWT
                 FALLBACK_JWT = device_token  # Actualiza
 
         logger.info("Triggering EPG load and auth refresh...")
         driver.execute_script("window.location.hash = '#spa/epg';")
-        time.sleep(3)
+        RUN_BUDGET.sleep(3)
         driver.execute_script("""
             if (window.dispatchEvent) {
                 window.dispatchEvent(new CustomEvent('login-ready'));
@@ -161,9 +205,9 @@ def get_session_via_selenium():
             }
             window.scrollTo(0, document.body.scrollHeight);
         """)
-        time.sleep(5)
+        RUN_BUDGET.sleep(5)
         driver.execute_script("window.scrollTo(0, 0);")
-        time.sleep(10)
+        RUN_BUDGET.sleep(10)
 
         # Wait for EPG
         try:
@@ -200,7 +244,6 @@ def get_session_via_selenium():
         """)
         if intercepted_uuid:
             logger.info(f"Intercepted UUID: {intercepted_uuid}")
-            global FALLBACK_UUID
             FALLBACK_UUID = intercepted_uuid
 
         local_storage = driver.execute_script("return localStorage;")
@@ -252,29 +295,31 @@ def get_session_via_selenium():
         driver.quit()
         return {}, None
 
-def fetch_uuid(jwt, cookies_dict, api_headers, account_id=None, region_id='18'):
-    """Fetch UUID; usa region_id=18. Si falla o UUID malo, fallback."""
+def new_session(cookies_dict=None):
+    """PooledSession con cookies de Selenium y FALLBACK_COOKIES para las que falten.
+
+    Concurrencia por host adaptativa (AIMD) hasta HOST_POOLS, con estado en HTTP_STATE.
+    """
+    session = PooledSession(HOST_POOLS, verify=False, adaptive=AdaptiveLimits(HTTP_STATE))
+    session.set_cookies(cookies_dict, domain=COOKIE_DOMAIN)
+    session.set_cookies(FALLBACK_COOKIES, domain=COOKIE_DOMAIN, overwrite=False)
+    return session
+
+def fetch_uuid(jwt, cookies_dict, api_headers, account_id=None, region_id='18', session=None):
+    """Fetch UUID; usa region_id=18. Si falla o UUID malo, fallback. Reutiliza session (pool + cookies)."""
+    if session is None:
+        session = new_session(cookies_dict)
     if not jwt:
         logger.info("No JWT - forcing fallback")
-        session = requests.Session()
-        for name, value in FALLBACK_COOKIES.items():
-            session.cookies.set(name, value, domain='.prod.ovp.ses.com')
         logger.info(f"Fallback forced: UUID {FALLBACK_UUID}")
         return FALLBACK_UUID, session
 
-    session = requests.Session()
-    for name, value in cookies_dict.items():
-        session.cookies.set(name, value, domain='.prod.ovp.ses.com')
-    for name, value in FALLBACK_COOKIES.items():
-        if name not in session.cookies:
-            session.cookies.set(name, value, domain='.prod.ovp.ses.com')
-
     headers = api_headers.copy()
     headers['authorization'] = f"Bearer {jwt}"
     logger.info(f"JWT used for /token: {jwt[:20]}... (type: {'full' if len(jwt)>200 else 'basic'})")
 
     try:
-        response = session.get(TOKEN_URL, headers=headers, timeout=15, verify=False)
+        response = session.get(TOKEN_URL, headers=headers, timeout=RUN_BUDGET.timeout(15), verify=False)
         logger.info(f"Token status: {response.status_code}")
         if response.status_code == 200:
             data = response.json()
@@ -284,7 +329,7 @@ def fetch_uuid(jwt, cookies_dict, api_headers, account_id=None, region_id='18'):
                 logger.info(f"Cache URL: {data['token']['cacheUrl']}")
             # Update cookies from response
             for cookie in response.cookies:
-                session.cookies.set(cookie.name, cookie.value, domain='.prod.ovp.ses.com', path=cookie.path or '/')
+                session.cookies.set(cookie.name, cookie.value, domain=COOKIE_DOMAIN, path=cookie.path or '/')
             # Check si UUID es "bueno" (matcha fallback o parece cacheado)
             if uuid_new != FALLBACK_UUID:
                 logger.warning(f"UUID fresh ({uuid_new[:8]}...) differs from fallback ({FALLBACK_UUID[:8]}...) - may cause 406")
@@ -294,11 +339,8 @@ def fetch_uuid(jwt, cookies_dict, api_headers, account_id=None, region_id='18'):
     except Exception as e:
         logger.error(f"Token error: {e}")
 
-    # Fallback si falla o UUID malo
+    # Fallback si falla o UUID malo (misma session: conexiones ya abiertas)
     logger.info(f"Using fallback UUID: {FALLBACK_UUID}")
-    session = requests.Session()
-    for name, value in FALLBACK_COOKIES.items():
-        session.cookies.set(name, value, domain='.prod.ovp.ses.com')
     return FALLBACK_UUID, session
 
 # Línea ~280: Función initialize_session (continuación/completada)
@@ -317,7 +359,7 @@ def initialize_session(jwt, session, api_headers):
     for url, name in [(CUSTOMER_URL, '/customer'), (ACCOUNT_URL, '/account')]:
         logger.info(f"Initializing: {name}...")
         try:
-            response = session.get(url, headers=headers, timeout=15, verify=False)
+            response = session.get(url, headers=headers, timeout=RUN_BUDGET.timeout(15), verify=False)
             logger.info(f"{name} status: {response.status_code}")
             if response.status_code == 200:
                 if name == '/customer':
@@ -336,7 +378,7 @@ def initialize_session(jwt, session, api_headers):
                         logger.info(f"Account: accountId={account_id}")
                 # Update cookies
                 for cookie in response.cookies:
-                    session.cookies.set(cookie.name, cookie.value, domain='.prod.ovp.ses.com', path=cookie.path or '/')
+                    session.cookies.set(cookie.name, cookie.value, domain=COOKIE_DOMAIN, path=cookie.path or '/')
             else:
                 logger.error(f"{name} error: {response.status_code} - {response.text[:100]}")
                 success = False
@@ -347,11 +389,16 @@ def initialize_session(jwt, session, api_headers):
     return success, account_id, region_id
 
 # Línea ~320: Función fetch_channel_epg (completada)
-def fetch_channel_epg(session, uuid_val, channel_id, start_date, end_date, auth_headers, jwt=None):
-    """Fetch EPG con headers completos, regionId=18 y retry."""
+def fetch_channel_epg(session, uuid_val, channel_id, start_date, end_date, auth_headers, jwt=None, cookies=None,
+                      lineup_id=None):
+    """Fetch EPG con headers completos, regionId=18 y retry.
+
+    cookies: si se pasa, el request va con un jar que tiene solo esas cookies (session.fork),
+    sin las de la session compartida; las conexiones del pool se reutilizan igual.
+    """
     date_from_ms = int(start_date.replace(minute=0, second=0, microsecond=0).timestamp() * 1000)
     date_to_ms = int(end_date.replace(minute=0, second=0, microsecond=0).timestamp() * 1000)
-    epg_url = f"{EPG_BASE_URL}/{uuid_val}/{channel_id}/{LINEUP_ID}"
+    epg_url = f"{EPG_BASE_URL}/{uuid_val}/{channel_id}/{lineup_id or LINEUP_ID}"
     params = {'page': 0, 'size': 100, 'dateFrom': date_from_ms, 'dateTo': date_to_ms}
     full_url = requests.Request('GET', epg_url, params=params).prepare().url
     logger.info(f"Fetching EPG for channel {channel_id}: {full_url}")
@@ -361,16 +408,18 @@ def fetch_channel_epg(session, uuid_val, channel_id, start_date, end_date, auth_
     if jwt:
         headers['authorization'] = f"Bearer {jwt}"
     logger.info(f"EPG headers (last 5): {dict(list(headers.items())[-5:])}")  # Incluye mn-regionid=18
+    if cookies is not None:
+        session = session.fork(cookies, domain=COOKIE_DOMAIN)  # requests mezclaria cookies= con el jar
 
     try:
-        response = session.get(epg_url, params=params, headers=headers, timeout=30, verify=False)
+        response = session.get(epg_url, params=params, headers=headers, timeout=RUN_BUDGET.timeout(30), verify=False)
         logger.info(f"EPG status for {channel_id}: {response.status_code}")
         if response.status_code != 200:
             logger.info(f"Response headers: {dict(response.headers)}")
             if response.status_code == 406:
                 logger.warning("406 - retrying with Accept: */*")
                 headers['accept'] = '*/*'
-                response = session.get(epg_url, params=params, headers=headers, timeout=30, verify=False)
+                response = session.get(epg_url, params=params, headers=headers, timeout=RUN_BUDGET.timeout(30), verify=False)
                 logger.info(f"Retry status for {channel_id}: {response.status_code}")
             if response.status_code != 200:
                 logger.error(f"EPG error for {channel_id}: {response.status_code} - {response.text[:200]}")
@@ -410,30 +459,99 @@ def fetch_channel_epg(session, uuid_val, channel_id, start_date, end_date, auth_
         logger.error(f"EPG fetch error for {channel_id}: {e}")
         return None
 
-# Línea ~380: Función build_xml_epg (sin cambios)
-def build_xml_epg(epg_data_list, output_file):
-    """Genera XMLTV desde datos EPG."""
-    root = ET.Element("tv")
-    root.set("source-info-url", "https://www.mvshub.com.mx")
-    root.set("source-info-name", "MVS Hub EPG")
+# Línea ~380: Función build_xml_epg (usa el modelo por columnas de guide_model)
+def load_previous_guide(output_file):
+    """Guide del XML de la corrida anterior, para rellenar canales que no se alcanzaron a pedir."""
+    if not os.path.exists(output_file):
+        return None
+    try:
+        return load_guide(output_file)
+    except (ET.ParseError, OSError) as e:
+        logger.warning(f"Previous {output_file} unreadable ({e}) - no cached data")
+        return None
 
-    # Channels hardcoded
-    for chan_id in CHANNEL_IDS:
+TV_ATTRIB = {"source-info-url": "https://www.mvshub.com.mx", "source-info-name": "MVS Hub EPG"}
+
+Lineup = namedtuple('Lineup', 'lineup_id region_id channels output')
+
+def parse_lineups(spec, default_region=None):
+    """Lineups de MVS_LINEUPS; sin spec, solo LINEUP_ID con CHANNEL_IDS en OUTPUT_FILE.
+
+    Un (lineup, region) repetido no crea otra salida: sus canales se suman a la primera.
+    """
+    targets = {}  # (lineup, region) -> Lineup, en orden de aparicion
+    root, ext = os.path.splitext(OUTPUT_FILE)
+    for part in (p.strip() for p in spec.split(';')):
+        if not part:
+            continue
+        head, _, chans = part.partition('=')
+        lineup_id, _, region_id = head.strip().partition(':')
+        lineup_id, region_id = lineup_id.strip(), region_id.strip() or default_region
+        channels = [int(c) for c in chans.split(',') if c.strip()] or list(CHANNEL_IDS)
+        key = (lineup_id, region_id)
+        if key in targets:
+            merged = targets[key].channels
+            merged.extend(c for c in channels if c not in merged)
+            continue
+        output = OUTPUT_FILE if not targets else f"{root}_{lineup_id}_{region_id}{ext}"
+        targets[key] = Lineup(lineup_id, region_id, list(dict.fromkeys(channels)), output)
+    return list(targets.values()) or [Lineup(LINEUP_ID, default_region, list(CHANNEL_IDS), OUTPUT_FILE)]
+
+def lineup_auth(jwt, auth_headers, targets):
+    """{region_id: auth headers}: los de init para su región, re-decodificados del JWT para las demás."""
+    account_id, region_id = auth_headers.get('x-account-id'), auth_headers.get('mn-regionid')
+    return {t.region_id: (decode_jwt(jwt, account_id=account_id, region_id=t.region_id)
+                          if account_id and t.region_id != region_id else auth_headers)
+            for t in targets}
+
+def channel_lineups(targets):
+    """{chan_id: Lineup}: cada canal se pide una vez, con el primer lineup que lo incluye."""
+    channel_lineup = {}
+    for target in targets:
+        for chan_id in target.channels:
+            channel_lineup.setdefault(chan_id, target)
+    if len(targets) > 1:
+        logger.info(f"Lineups: {[(t.lineup_id, t.region_id, len(t.channels)) for t in targets]} - "
+                    f"{len(channel_lineup)} unique channels")
+    return channel_lineup
+
+def channels_guide(channel_ids=None):
+    """Guide solo con los canales hardcoded (los <channel> van al inicio del XML)."""
+    guide = Guide()
+    for chan_id in CHANNEL_IDS if channel_ids is None else channel_ids:
         chan_info = HARDCODED_CHANNELS.get(chan_id, {'name': f'Canal {chan_id}', 'logo': ''})
-        chan_elem = ET.SubElement(root, "channel")
-        chan_elem.set("id", f"MVS.{chan_id}")
-        display_name = ET.SubElement(chan_elem, "display-name")
-        display_name.text = chan_info['name']
-        if chan_info['logo']:
-            icon = ET.SubElement(chan_elem, "icon")
-            icon.set("src", chan_info['logo'])
+        guide.add_channel(f"MVS.{chan_id}", chan_info['name'], chan_info['logo'])
+    return guide
+
+def cached_rows(previous_guide, chan_id, min_start):
+    """Filas de previous_guide para chan_id que aún no pasaron."""
+    return [i for i in previous_guide.rows_for(f"MVS.{chan_id}") if previous_guide.start[i] >= min_start]
+
+def append_cached(add_rows, previous_guide, chan_id, min_start):
+    """Rellena un canal sin datos frescos (fallo o deadline) con lo cacheado de la corrida anterior.
+
+    add_rows(guide, filas) es Guide.extend_from o GuideWriter.write_rows; retorna cuántas filas agregó.
+    """
+    cached = cached_rows(previous_guide, chan_id, min_start)
+    if cached:
+        add_rows(previous_guide, cached)
+        logger.info(f"Channel {chan_id}: no fresh data - using {len(cached)} cached programmes")
+    return len(cached)
+
+def events_to_guide(epg_data_list, previous_guide=None, min_start=None, channel_ids=None):
+    """Pasa los eventos JSON al Guide: un solo recorrido de .get() y strings internados.
+
+    Canales sin eventos frescos se rellenan con sus programas de previous_guide (si hay).
+    """
+    channel_ids = CHANNEL_IDS if channel_ids is None else channel_ids
+    guide = channels_guide(channel_ids)
 
     # Programmes
-    now = datetime.now()
-    total_programmes = 0
+    if min_start is None:
+        min_start = time.time() - 3600  # Skip past events (más de 1h)
     for epg_data in epg_data_list or []:
         channel_id = epg_data.get('channelId')
-        if channel_id not in CHANNEL_IDS:
+        if channel_id not in channel_ids:
             continue
 
         for event in epg_data.get('events', []):
@@ -441,40 +559,13 @@ def build_xml_epg(epg_data_list, output_file):
             end_ms = int(event.get('endDateTime', 0))
             if start_ms == 0 or end_ms == 0:
                 continue
-
-            prog_start = datetime.fromtimestamp(start_ms / 1000)
-            prog_stop = datetime.fromtimestamp(end_ms / 1000)
-
-            # Skip past events
-            if prog_start < now - timedelta(hours=1):
+            if start_ms / 1000 < min_start:
                 continue
 
-            # XMLTV times (UTC assumed)
-            start_str = prog_start.strftime("%Y%m%d%H%M%S") + " +0000"
-            stop_str = prog_stop.strftime("%Y%m%d%H%M%S") + " +0000"
-
-            prog_elem = ET.SubElement(root, "programme")
-            prog_elem.set("start", start_str)
-            prog_elem.set("stop", stop_str)
-            prog_elem.set("channel", f"MVS.{channel_id}")
-
-            # Title
-            title_text = event.get('title', 'Unknown')
-            title = ET.SubElement(prog_elem, "title")
-            title.set("lang", "es")
-            title.text = title_text
-
-            # Desc
-            desc = event.get('description', '')
-            if desc:
-                desc_elem = ET.SubElement(prog_elem, "desc")
-                desc_elem.set("lang", "es")
-                desc_elem.text = desc
-
             # Category from genre
             genre = event.get('genre', '')
+            category_text = ''
             if genre:
-                category_text = ''
                 if isinstance(genre, str):
                     category_text = genre.split(',')[0].strip()
                 elif isinstance(genre, dict) and 'genres' in genre:
@@ -482,32 +573,164 @@ def build_xml_epg(epg_data_list, output_file):
                     category_text = genres_list[0].get('name', '') if genres_list else ''
                 else:
                     category_text = str(genre).split(',')[0].strip()
-                if category_text:
-                    cat_elem = ET.SubElement(prog_elem, "category")
-                    cat_elem.set("lang", "es")
-                    cat_elem.text = category_text
 
             # Episode (season)
             season_num = event.get('seasonNumber')
+            episode = None
             if season_num is not None and season_num >= 0:
-                ep_elem = ET.SubElement(prog_elem, "episode-num")
-                ep_elem.set("system", "xmltv_ns")
-                ep_elem.text = f"0/{season_num + 1}/0"
-
-            total_programmes += 1
+                episode = ('xmltv_ns', f"0/{season_num + 1}/0")
+
+            guide.add_programme(f"MVS.{channel_id}", start_ms // 1000, end_ms // 1000,
+                                title=event.get('title', 'Unknown'),
+                                desc=event.get('description', ''),
+                                categories=[category_text],
+                                episode=episode,
+                                lang='es')
+
+    if previous_guide is not None:
+        for chan_id in channel_ids:
+            if not guide.rows_for(f"MVS.{chan_id}"):
+                append_cached(guide.extend_from, previous_guide, chan_id, min_start)
+    return guide
+
+def build_xml_epg(epg_data_iter, output_file, previous_guide=None):
+    """Genera XMLTV desde datos EPG (tiempos en UTC); previous_guide rellena canales faltantes.
+
+    epg_data_iter puede ser una lista o el bounded_pipeline de main(): los <channel>
+    se escriben primero y cada canal se serializa apenas llega, sin juntar la guía entera.
+    """
+    target = Lineup(LINEUP_ID, None, list(CHANNEL_IDS), output_file)
+    return build_xml_epgs(epg_data_iter, [target], {output_file: previous_guide})
+
+def build_xml_epgs(epg_data_iter, targets, previous_guides=None):
+    """Como build_xml_epg pero para varios lineups: cada canal que llega va a todas las salidas que lo incluyen.
+
+    Una salida sin ningún programa (ni fresco ni cacheado) no se publica: se descartan sus .tmp y
+    queda el archivo anterior. Retorna la lista de esas salidas vacías.
+    """
+    min_start = time.time() - 3600  # Skip past events (más de 1h)
+    previous_guides = previous_guides or {}
+    fresh = set()  # (output, chan_id)
+    with ExitStack() as stack:
+        writers, outputs = [], []
+        for target in targets:
+            f_out = stack.enter_context(open_output(target.output))  # + .xml.gz/.xml.xz
+            outputs.append(f_out)
+            writers.append((target, GuideWriter(f_out, channels_guide(target.channels), TV_ATTRIB)))
+        for epg_data in epg_data_iter:
+            chan_id = epg_data.get('channelId')
+            chunk = None
+            for target, writer in writers:
+                if chan_id not in target.channels:
+                    continue
+                if chunk is None:
+                    chunk = events_to_guide([epg_data], min_start=min_start, channel_ids=[chan_id])
+                if writer.write_rows(chunk):
+                    fresh.add((target.output, chan_id))
+        empty = []
+        for (target, writer), f_out in zip(writers, outputs):
+            previous_guide = previous_guides.get(target.output)
+            if previous_guide is not None:
+                for chan_id in target.channels:
+                    if (target.output, chan_id) not in fresh:
+                        append_cached(writer.write_rows, previous_guide, chan_id, min_start)
+            if writer.written:
+                writer.close()
+            else:
+                f_out.abort()  # Nunca pisar la guía anterior con una vacía
+                empty.append(target.output)
+                logger.error(f"{target.output}: no programmes (fresh or cached) - keeping previous file")
+    for n, (target, writer) in enumerate(writers):
+        if target.output in empty:
+            continue
+        logger.info(f"XML written to {target.output}: {writer.written} programmes, {len(target.channels)} channels")
+        snapshot_xmltv(target.output)
+        if SHARDS_DIR:
+            shards_dir = SHARDS_DIR if n == 0 else os.path.join(SHARDS_DIR, f"{target.lineup_id}_{target.region_id}")
+            write_shards(target.output, shards_dir, by=SHARDS_BY)
+    return empty
+
+def fetch_epgs(session, uuid_val, auth_headers, jwt, targets, previous_guides):
+    """Todo lo que sigue al login: pide los canales de targets y escribe sus XML (build_xml_epgs).
+
+    auth_headers son los de decode_jwt con accountId/regionId de init. Cierra session al
+    terminar; retorna las salidas vacías. main() y bench_fetch.py pasan por aquí.
+    """
+    account_id = auth_headers.get('x-account-id')
+    region_auth = lineup_auth(jwt, auth_headers, targets)
+    channel_lineup = channel_lineups(targets)
+
+    # Fetch EPG (7 days): el fetcher corre en un hilo y entrega cada canal por una cola acotada;
+    # build_xml_epg lo serializa mientras se pide el siguiente
+    end_date = datetime.now() + timedelta(days=7)
+    start_date = datetime.now()
+    ordered = order_by_priority(list(channel_lineup), CHANNEL_PRIORITIES)
+
+    def fetch_one(chan_id):
+        if RUN_BUDGET.expired():
+            return chan_id, None, True
+        target = channel_lineup[chan_id]
+        epg_data = fetch_channel_epg(session, uuid_val, chan_id, start_date, end_date,
+                                     region_auth[target.region_id], jwt, lineup_id=target.lineup_id)
+        if epg_data is None and not RUN_BUDGET.expired():
+            logger.warning(f"EPG failed with fresh UUID for {chan_id} - retrying with fallback")
+            # Fallback: mismos pools (conexión viva) pero jar aislado con FALLBACK_COOKIES, UUID hardcodeado, JWT full
+            # Auth headers con accountId/regionId de init + JWT full
+            fallback_auth = decode_jwt(FALLBACK_JWT_FULL, account_id=account_id, region_id=target.region_id)
+            epg_data = fetch_channel_epg(session, FALLBACK_UUID, chan_id, start_date, end_date, fallback_auth,
+                                         FALLBACK_JWT_FULL, cookies=FALLBACK_COOKIES, lineup_id=target.lineup_id)
+            if epg_data:
+                logger.info(f"Success with fallback UUID + FULL JWT for {chan_id}: {len(epg_data['events'])} events")
+            else:
+                logger.error(f"Fallback also failed for {chan_id}")
+        return chan_id, epg_data, False
+
+    def fetch_all(put):
+        # Sin sleep fijo entre canales: el limitador AIMD de la session decide cuántos van en vuelo
+        # Ventana de workers + PIPELINE_DEPTH futures: no se acumulan payloads más allá de la cola
+        # acotada y tras el deadline no queda nada encolado en el pool
+        workers = HOST_POOLS.get(origin_of(EPG_BASE_URL), 1)
+        window = workers + PIPELINE_DEPTH
+        pending = deque(ordered)
+        in_flight = deque()
+        skipped = []
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < window and not RUN_BUDGET.expired():
+                    in_flight.append(pool.submit(fetch_one, pending.popleft()))
+                if not in_flight:  # Deadline vencido sin nada en vuelo
+                    skipped.extend(pending)
+                    break
+                chan_id, epg_data, expired = in_flight.popleft().result()  # En orden de prioridad
+                if expired:
+                    skipped.append(chan_id)
+                elif epg_data:
+                    put(epg_data)
+                else:
+                    logger.warning(f"No data for {chan_id} - skipping")
+        finally:
+            # Si falla un fetch o el consumidor corta (PipelineClosed), los que no arrancaron no se piden;
+            # la session se cierra igual: guarda el estado AIMD por host y suelta los pools
+            pool.shutdown(cancel_futures=True)
+            session.close()
+        if skipped:
+            logger.warning(f"Run deadline reached after {RUN_BUDGET.elapsed():.0f}s - "
+                           f"{len(skipped)} channels left, using cached data: {skipped}")
 
-    # Write XML
-    tree = ET.ElementTree(root)
-    try:
-        ET.indent(tree, space="  ", level=0)
-    except AttributeError:
-        pass  # Python <3.9
-    tree.write(output_file, encoding='utf-8', xml_declaration=True)
-    logger.info(f"XML written to {output_file}: {total_programmes} programmes, {len(CHANNEL_IDS)} channels")
+    # Build XML
+    return build_xml_epgs(bounded_pipeline(fetch_all, PIPELINE_DEPTH, name='mvshub-fetch'), targets, previous_guides)
 
 # Línea ~460: Función main (completada)
 def main():
-    """Flujo principal: Selenium → init session (accountId/regionId) → UUID fresco → EPG con retry fallback."""
+    """Flujo principal: Selenium → init session (accountId/regionId) → UUID fresco → EPG con retry fallback.
+
+    Con RUN_DEADLINE definido todo corre contra RUN_BUDGET: al llegar al deadline se deja de pedir
+    canales y el XML se escribe con lo obtenido + los datos de la corrida anterior para los que faltan.
+    """
+    global RUN_BUDGET
+    RUN_BUDGET = RunBudget(RUN_DEADLINE, reserve=10)
+    logger.info(f"Run budget: {RUN_BUDGET}")
     # Selenium para cookies y JWT
     cookies_dict, jwt = get_session_via_selenium()
     if jwt:
@@ -517,13 +740,8 @@ def main():
         auth_headers = {}
         logger.warning("No JWT - using basic auth headers")
 
-    # Crea session inicial
-    session = requests.Session()
-    for name, value in cookies_dict.items():
-        session.cookies.set(name, value, domain='.prod.ovp.ses.com')
-    for name, value in FALLBACK_COOKIES.items():
-        if name not in session.cookies:
-            session.cookies.set(name, value, domain='.prod.ovp.ses.com')
+    # Crea la session (pools por host:port) que se usa en toda la corrida
+    session = new_session(cookies_dict)
 
     # PRIMERO: Initialize session (/customer y /account) para warm up y obtener accountId/regionId
     logger.info("Warming up session with /customer and /account...")
@@ -541,38 +759,31 @@ def main():
         logger.info(f"Updated auth headers with accountId={account_id}, regionId={region_id}")
 
     # AHORA: Fetch UUID fresco (post-init, con regionId=18)
-    uuid_fresh, session = fetch_uuid(jwt, cookies_dict, API_HEADERS, account_id=account_id, region_id=region_id)
+    uuid_fresh, session = fetch_uuid(jwt, cookies_dict, API_HEADERS, account_id=account_id, region_id=region_id,
+                                     session=session)
     logger.info(f"Using UUID after init: {uuid_fresh[:8]}...")
 
-    # Fetch EPG (7 days)
-    epg_list = []
-    end_date = datetime.now() + timedelta(days=7)
-    start_date = datetime.now()
-    for chan_id in CHANNEL_IDS:
-        epg_data = fetch_channel_epg(session, uuid_fresh, chan_id, start_date, end_date, auth_headers, jwt)
-        if epg_data is None:
-            logger.warning(f"EPG failed with fresh UUID for {chan_id} - retrying with fallback")
-            # Fallback: Nueva session con UUID hardcodeado, cookies fallback, JWT full y auth actualizado
-            session_fallback = requests.Session()
-            for name, value in FALLBACK_COOKIES.items():
-                session_fallback.cookies.set(name, value, domain='.prod.ovp.ses.com')
-            # Auth headers con accountId/regionId de init + JWT full
-            fallback_auth = decode_jwt(FALLBACK_JWT_FULL, account_id=account_id, region_id=region_id)
-            epg_data = fetch_channel_epg(session_fallback, FALLBACK_UUID, chan_id, start_date, end_date, fallback_auth, FALLBACK_JWT_FULL)
-            if epg_data:
-                logger.info(f"Success with fallback UUID + FULL JWT for {chan_id}: {len(epg_data['events'])} events")
-            else:
-                logger.error(f"Fallback also failed for {chan_id}")
-        if epg_data:
-            epg_list.append(epg_data)
-        else:
-            logger.warning(f"No data for {chan_id} - skipping")
-        time.sleep(1)  # Rate limit
-
-    # Build XML
-    build_xml_epg(epg_list, OUTPUT_FILE)
-    logger.info("EPG generation completed! Check epgmvs.xml")
+    # Lineups de la corrida; antes de sobrescribir, cada guía anterior queda como caché de sus canales
+    targets = parse_lineups(MVS_LINEUPS, default_region=region_id)
+    previous_guides = {t.output: load_previous_guide(t.output) for t in targets}
+    empty = fetch_epgs(session, uuid_fresh, auth_headers, jwt, targets, previous_guides)
+    if empty:
+        logger.error(f"EPG generation failed for {', '.join(empty)} - previous files kept")
+        sys.exit(1)
+    logger.info(f"EPG generation completed! Check {', '.join(t.output for t in targets)}")
+
+def print_startup_profile():
+    """Reporte de --profile-startup: ms por fase de import hasta poder llamar main()."""
+    checkpoints = _STARTUP + [('ready', time.perf_counter())]
+    print("Startup profile (ms):")
+    for (_, prev), (name, t) in zip(checkpoints, checkpoints[1:]):
+        print(f"  {name:<15} {(t - prev) * 1000:8.1f}")
+    print(f"  {'total':<15} {(checkpoints[-1][1] - checkpoints[0][1]) * 1000:8.1f}")
+    print(f"  selenium loaded: {'selenium' in sys.modules}, webdriver_manager loaded: {'webdriver_manager' in sys.modules}")
 
 # Línea ~510: Entry point
 if __name__ == "__main__":
-    main()
+    if '--profile-startup' in sys.argv:
+        print_startup_profile()
+    else:
+        main()
@@ -0,0 +1,93 @@
+"""Feed JSON compacto de "ahora / siguiente" por canal.
+
+Lee las guias generadas (via snapshot, sin reparsear si estan al dia) y escribe:
+
+    {"generated": epoch, "bucket": 1800, "horizon_start": epoch, "buckets": N,
+     "channels": {"<id>": {"name": ..., "start": [...], "stop": [...], "title": [...],
+                           "now": [...], "next": [...]}}}
+
+start/stop/title son columnas paralelas ordenadas por start. now[b] / next[b] son
+indices (o -1) del programa al aire / siguiente al inicio del bucket b de 30
+minutos. Un cliente resuelve cualquier instante con now/next del bucket o con un
+binary search sobre start.
+"""
+from bisect import bisect_right
+import argparse
+import json
+import logging
+import os
+import time
+
+from epg_output import open_output
+from guide_snapshot import load_guide
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOURCES = ['guia_filtrada.xml', 'guiamix.xml', 'mlb.xml', 'epgmvs.xml']
+DEFAULT_OUTPUT = 'now_next.json'
+BUCKET_SECONDS = 1800
+HORIZON_HOURS = int(os.environ.get('NOW_NEXT_HORIZON_HOURS', '48'))
+
+
+def now_next_at(starts, stops, t):
+    """(indice ahora, indice siguiente) en t, con -1 si no hay."""
+    i = bisect_right(starts, t) - 1
+    now = i if i >= 0 and stops[i] > t else -1
+    nxt = i + 1 if i + 1 < len(starts) else -1
+    return now, nxt
+
+
+def build_feed(xml_paths, now=None, horizon_hours=HORIZON_HOURS, bucket=BUCKET_SECONDS):
+    """Arma el dict del feed a partir de las guias en xml_paths."""
+    now = int(now if now is not None else time.time())
+    horizon_start = now - now % bucket
+    n_buckets = horizon_hours * 3600 // bucket
+    horizon_end = horizon_start + n_buckets * bucket
+    channels = {}
+    for path in xml_paths:
+        guide = load_guide(path)
+        per_channel = {}
+        for i in range(len(guide)):
+            # Solo lo que toca el horizonte
+            if guide.stop[i] <= horizon_start or guide.start[i] >= horizon_end:
+                continue
+            per_channel.setdefault(guide.channel[i], []).append(i)
+        for idx, cid in enumerate(guide.channel_ids):
+            rows = sorted(per_channel.get(idx, []), key=lambda r: guide.start[r])
+            starts = [guide.start[r] for r in rows]
+            stops = [guide.stop[r] for r in rows]
+            now_idx, next_idx = [], []
+            for b in range(n_buckets):
+                n, x = now_next_at(starts, stops, horizon_start + b * bucket)
+                now_idx.append(n)
+                next_idx.append(x)
+            channels[cid] = {
+                'name': guide.strings[guide.channel_names[idx]],
+                'start': starts,
+                'stop': stops,
+                'title': [guide.strings[guide.title[r]] for r in rows],
+                'now': now_idx,
+                'next': next_idx,
+            }
+    return {'generated': now, 'bucket': bucket, 'horizon_start': horizon_start,
+            'buckets': n_buckets, 'channels': channels}
+
+
+def write_feed(xml_paths, output=DEFAULT_OUTPUT, **kwargs):
+    feed = build_feed(xml_paths, **kwargs)
+    with open_output(output) as f:
+        f.write(json.dumps(feed, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    logger.info(f"Now/next feed written to {output}: {len(feed['channels'])} channels, {feed['buckets']} buckets")
+    return feed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Genera el feed now/next JSON desde las guias XMLTV.")
+    parser.add_argument('guias', nargs='*', help=f"XMLTV de entrada (default: {' '.join(DEFAULT_SOURCES)})")
+    parser.add_argument('-o', '--salida', default=DEFAULT_OUTPUT)
+    parser.add_argument('--horas', type=int, default=HORIZON_HOURS, help="Horizonte en horas (default 48)")
+    parser.add_argument('--ahora', type=int, default=None, help="Epoch de inicio (default: ahora)")
+    args = parser.parse_args()
+    sources = args.guias or [p for p in DEFAULT_SOURCES if os.path.exists(p)]
+    write_feed(sources, args.salida, now=args.ahora, horizon_hours=args.horas)
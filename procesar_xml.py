@@ -1,5 +1,18 @@
 import xml.etree.ElementTree as ET
-import sys
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import argparse
+import html
+import json
+import mmap
+import os
+import re
+import unicodedata
+
+from epg_output import open_output
+from epg_shards import SHARD_LAYOUTS, write_shards
+from guide_snapshot import snapshot_xmltv
 
 # Lista de IDs de canales que quieres conservar (modifica con tus IDs reales)
 canales_mexico = [
@@ -98,15 +111,346 @@ def filtrar_epg(input_xml, output_xml, canales_filtrar):
         if programa.get('channel') not in canales_filtrar:
             root.remove(programa)
 
-    # Guardar nuevo XML
-    tree.write(output_xml, encoding='utf-8', xml_declaration=True)
+    # Guardar nuevo XML (+ .gz/.xz en la misma pasada)
+    with open_output(output_xml) as f_out:
+        tree.write(f_out, encoding='utf-8', xml_declaration=True)
+
+# Modo mmap: filtra a nivel de bytes sin construir elementos.
+# Solo acepta la forma plana de XMLTV (prolog, <tv>, <channel>/<programme> de primer nivel, </tv>).
+_RE_PROLOGO = re.compile(
+    rb'\s*(?:<\?xml(?P<decl>[^>]*)\?>)?\s*(?:<!DOCTYPE[^>]*>\s*)?(?:<!--.*?-->\s*)*<tv\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*(?<!/)>',
+    re.DOTALL)
+_RE_ENCODING = re.compile(rb'encoding=["\']([^"\']+)["\']')
+_RE_ELEMENTO = re.compile(rb'\s*<(channel|programme)\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+_RE_ESPACIOS = re.compile(rb'\s*')
+_RE_ATRIBUTO = {
+    b'channel': re.compile(rb'\sid=(["\'])(.*?)\1', re.DOTALL),
+    b'programme': re.compile(rb'\schannel=(["\'])(.*?)\1', re.DOTALL),
+}
+
+
+def delimitar_tv(buf):
+    """Valida prolog y cierre; retorna (inicio, fin) del contenido de <tv>."""
+    m = _RE_PROLOGO.match(buf)
+    if not m:
+        raise ValueError("Estructura inesperada: no se encontro <tv> al inicio del archivo")
+    if m.group('decl'):
+        enc = _RE_ENCODING.search(m.group('decl'))
+        if enc and enc.group(1).lower() not in (b'utf-8', b'utf8', b'us-ascii', b'ascii'):
+            raise ValueError(f"Encoding no soportado en modo mmap: {enc.group(1).decode()}")
+    cierre = buf.rfind(b'</tv>')
+    if cierre < m.end() or _RE_ESPACIOS.match(buf, cierre + 5).end() != len(buf):
+        raise ValueError("Estructura inesperada: falta </tv> al final del archivo")
+    return m.end(), cierre
+
+
+def escanear_elementos(buf, inicio, fin):
+    """Recorre <channel>/<programme> de primer nivel en buf[inicio:fin].
+
+    Genera (tag, desde, hasta, clave) donde desde incluye el espacio previo y
+    clave es el valor crudo de id/channel. Lanza ValueError ante cualquier otra cosa.
+    """
+    pos = inicio
+    while pos < fin:
+        m = _RE_ELEMENTO.match(buf, pos, fin)
+        if not m:
+            if _RE_ESPACIOS.match(buf, pos, fin).end() == fin:
+                return
+            raise ValueError(f"Estructura inesperada en byte {pos}: se esperaba <channel> o <programme>")
+        tag = m.group(1)
+        attr = _RE_ATRIBUTO[tag].search(m.group(2))
+        if not attr:
+            raise ValueError(f"<{tag.decode()}> sin atributo de canal en byte {m.start(1) - 1}")
+        if m.group(2).endswith(b'/'):
+            hasta = m.end()
+        else:
+            cierre = buf.find(b'</' + tag + b'>', m.end(), fin)
+            if cierre == -1 or buf.find(b'<' + tag, m.end(), cierre) != -1:
+                raise ValueError(f"<{tag.decode()}> sin cerrar en byte {m.start(1) - 1}")
+            hasta = cierre + len(tag) + 3
+        yield tag, pos, hasta, attr.group(2)
+        pos = hasta
+
+
+def _claves_bytes(canales_filtrar):
+    """IDs tal como aparecen escapados dentro de un atributo."""
+    return {escape(c, {'"': '&quot;'}).encode('utf-8') for c in canales_filtrar}
+
+
+def filtrar_epg_mmap(input_xml, output_xml, canales_filtrar):
+    """Igual que filtrar_epg pero copiando rangos de bytes desde un mmap.
+
+    output_xml puede ser una ruta o un file-like binario ya abierto.
+    """
+    claves = _claves_bytes(canales_filtrar)
+    with open(input_xml, 'rb') as f_in, mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        inicio, fin = delimitar_tv(buf)
+        vista = memoryview(buf)
+        try:
+            destino = open_output(output_xml) if isinstance(output_xml, str) else nullcontext(output_xml)
+            with destino as f_out:
+                f_out.write(vista[:inicio])
+                # Junta rangos contiguos para escribir en bloques grandes
+                desde = hasta = None
+                for _tag, a, b, clave in escanear_elementos(buf, inicio, fin):
+                    if clave not in claves:
+                        continue
+                    if a != hasta:
+                        if desde is not None:
+                            f_out.write(vista[desde:hasta])
+                        desde = a
+                    hasta = b
+                if desde is not None:
+                    f_out.write(vista[desde:hasta])
+                f_out.write(b'\n')
+                f_out.write(vista[fin:])
+        finally:
+            vista.release()
+
+# Modo paralelo: divide el contenido de <tv> en rangos alineados a elementos de primer nivel
+_RE_INICIO_ELEMENTO = re.compile(rb'<(?:channel|programme)\b')
+
+
+def _rangos_shards(buf, inicio, fin, n):
+    """Corta [inicio, fin) en hasta n rangos que empiezan en un <channel>/<programme>."""
+    cortes = [inicio]
+    paso = max(1, (fin - inicio) // n)
+    for k in range(1, n):
+        m = _RE_INICIO_ELEMENTO.search(buf, max(inicio + k * paso, cortes[-1] + 1), fin)
+        if not m:
+            break
+        if m.start() > cortes[-1]:
+            cortes.append(m.start())
+    cortes.append(fin)
+    return list(zip(cortes, cortes[1:]))
+
+
+def _filtrar_shard(input_xml, desde, hasta, claves):
+    """Worker: retorna (bytes de canales, bytes de programas) conservados en el rango."""
+    canales, programas = [], []
+    with open(input_xml, 'rb') as f_in, mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for tag, a, b, clave in escanear_elementos(buf, desde, hasta):
+            if clave in claves:
+                (canales if tag == b'channel' else programas).append(buf[a:b])
+    return b''.join(canales), b''.join(programas)
+
+
+def filtrar_epg_paralelo(input_xml, output_xml, canales_filtrar, workers=None):
+    """Filtra por shards en un ProcessPoolExecutor; salida con canales primero y programas despues."""
+    workers = workers or os.cpu_count() or 1
+    claves = _claves_bytes(canales_filtrar)
+    with open(input_xml, 'rb') as f_in, mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        inicio, fin = delimitar_tv(buf)
+        cabecera, cola = buf[:inicio], buf[fin:]
+        rangos = _rangos_shards(buf, inicio, fin, workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = [pool.submit(_filtrar_shard, input_xml, a, b, claves) for a, b in rangos]
+        # .result() en orden conserva el orden original de cada tipo
+        resultados = [f.result() for f in futuros]
+
+    with open_output(output_xml) as f_out:
+        f_out.write(cabecera)
+        for canales, _ in resultados:
+            f_out.write(canales)
+        for _, programas in resultados:
+            f_out.write(programas)
+        f_out.write(b'\n')
+        f_out.write(cola)
+
+
+# Feeds derivados: filtros por contenido (title/sub-title/desc/category) evaluados
+# en la misma pasada de bytes; varias salidas salen de una sola lectura de la entrada.
+CAMPOS_TEXTO = ('title', 'sub-title', 'desc')
+_RE_CAMPO = re.compile(rb'<(title|sub-title|desc|category)\b[^>]*>(.*?)</\1>', re.DOTALL)
+
+# Definiciones por defecto; --definiciones JSON las reemplaza con el mismo formato
+DERIVADOS = {
+    'deportes': {
+        'categorias': ['Sports', 'Sports event', 'Sports talk', 'Sports non-event', 'Soccer', 'Football',
+                      'Baseball', 'Basketball', 'Boxing', 'Wrestling', 'Deportes', 'Futbol'],
+        'palabras': ['futbol', 'liga mx', 'nfl', 'nba', 'mlb', 'nhl', 'ufc', 'box', 'lucha libre',
+                     'formula 1', 'f1', 'tenis', 'golf'],
+    },
+    'peliculas': {
+        'categorias': ['Movie', 'Pelicula', 'Cine'],
+    },
+}
+
+
+def normalizar_texto(texto):
+    """Minusculas y sin acentos, para comparar 'Fútbol' con 'futbol'."""
+    texto = unicodedata.normalize('NFKD', texto.casefold())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+class FiltroContenido:
+    """Un feed derivado: categorias exactas o palabras clave en los campos de texto.
+
+    Las palabras se compilan en un solo regex alternado (las mas largas primero),
+    con limites de palabra que tambien funcionan para claves como 'F1' o 'UFC:'.
+    canales opcionalmente restringe el feed a esos IDs.
+    """
+
+    def __init__(self, palabras=(), categorias=(), campos=CAMPOS_TEXTO, canales=None):
+        palabras = sorted({normalizar_texto(p) for p in palabras if p.strip()}, key=len, reverse=True)
+        self.regex = (re.compile(r'(?<!\w)(?:' + '|'.join(map(re.escape, palabras)) + r')(?!\w)')
+                      if palabras else None)
+        self.categorias = {normalizar_texto(c) for c in categorias}
+        self.campos = tuple(campos)
+        self.claves = _claves_bytes(canales) if canales else None
+
+    @classmethod
+    def desde_dict(cls, definicion):
+        return cls(definicion.get('palabras', ()), definicion.get('categorias', ()),
+                   definicion.get('campos', CAMPOS_TEXTO), definicion.get('canales'))
+
+    def acepta(self, clave, campos):
+        """campos: {tag: [texto normalizado, ...]} del programa."""
+        if self.claves is not None and clave not in self.claves:
+            return False
+        if self.categorias and not self.categorias.isdisjoint(campos.get('category', ())):
+            return True
+        if self.regex is not None:
+            return any(self.regex.search(t) for campo in self.campos for t in campos.get(campo, ()))
+        return False
+
+
+def campos_programa(elemento):
+    """Extrae title/sub-title/desc/category de los bytes de un <programme>."""
+    campos = {}
+    for m in _RE_CAMPO.finditer(elemento):
+        texto = html.unescape(m.group(2).decode('utf-8', 'replace'))
+        campos.setdefault(m.group(1).decode(), []).append(normalizar_texto(texto.strip()))
+    return campos
+
+
+def filtrar_derivados(input_xml, salidas, canales_filtrar=None, output_xml=None):
+    """Escribe varios feeds derivados con una sola pasada sobre input_xml.
+
+    salidas: {ruta: FiltroContenido}. canales_filtrar (si se da) acota todo: los
+    derivados salen de lo mismo que guia_filtrada.xml, no de la guia completa. Si
+    se da output_xml, en la misma pasada se escribe tambien ese filtro por canales.
+    Cada salida lleva solo los <channel> con algun programa aceptado, primero.
+    Retorna {ruta: programas escritos}.
+    """
+    claves = _claves_bytes(canales_filtrar) if canales_filtrar is not None else None
+    with open(input_xml, 'rb') as f_in, mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        inicio, fin = delimitar_tv(buf)
+        canales = {}  # clave -> (desde, hasta) del <channel>
+        principal = []  # rangos en orden original para output_xml
+        rangos = {ruta: [] for ruta in salidas}
+        usados = {ruta: set() for ruta in salidas}
+        for tag, a, b, clave in escanear_elementos(buf, inicio, fin):
+            if claves is not None and clave not in claves:
+                continue
+            if output_xml is not None:
+                principal.append((a, b))
+            if tag == b'channel':
+                canales.setdefault(clave, (a, b))
+                continue
+            campos = None  # Se extraen una vez por programa, solo si algun filtro los pide
+            for ruta, filtro in salidas.items():
+                if filtro.claves is not None and clave not in filtro.claves:
+                    continue
+                if campos is None:
+                    campos = campos_programa(buf[a:b])
+                if filtro.acepta(clave, campos):
+                    rangos[ruta].append((a, b))
+                    usados[ruta].add(clave)
+
+        vista = memoryview(buf)
+        try:
+            if output_xml is not None:
+                with open_output(output_xml) as f_out:
+                    _escribir_rangos(f_out, vista, inicio, fin, principal)
+            for ruta, programas in rangos.items():
+                orden = sorted((canales[c] for c in usados[ruta] if c in canales))
+                with open_output(ruta) as f_out:
+                    _escribir_rangos(f_out, vista, inicio, fin, orden + programas)
+        finally:
+            vista.release()
+    return {ruta: len(programas) for ruta, programas in rangos.items()}
+
+
+def _escribir_rangos(f_out, vista, inicio, fin, rangos):
+    """Prolog + rangos (juntando los contiguos) + cierre."""
+    f_out.write(vista[:inicio])
+    desde = hasta = None
+    for a, b in rangos:
+        if a != hasta:
+            if desde is not None:
+                f_out.write(vista[desde:hasta])
+            desde = a
+        hasta = b
+    if desde is not None:
+        f_out.write(vista[desde:hasta])
+    f_out.write(b'\n')
+    f_out.write(vista[fin:])
+
+
+def rutas_derivadas(archivo, nombres):
+    """guiamix.xml + deportes -> guiamix_deportes.xml"""
+    raiz, ext = os.path.splitext(archivo)
+    return {n: f"{raiz}_{n}{ext or '.xml'}" for n in nombres}
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Uso: python procesar_xml.py archivo_entrada.xml archivo_salida.xml")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Filtra un XMLTV dejando solo los canales de canales_mexico.")
+    parser.add_argument('archivo_entrada')
+    parser.add_argument('archivo_salida', nargs='?', default=None,
+                        help="Salida filtrada por canales (opcional si se usa --derivados)")
+    parser.add_argument('--modo', choices=['tree', 'mmap', 'paralelo'], default=None,
+                        help="tree: ElementTree (default); mmap: escaneo de bytes, mucho mas rapido para guias grandes; "
+                             "paralelo: escaneo de bytes repartido entre procesos. No combina con --derivados, "
+                             "que siempre hace su propia pasada mmap")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Procesos para --modo paralelo (default: todos los cores)")
+    parser.add_argument('--shards', metavar='DIR', default=None,
+                        help="Ademas escribe fragmentos por canal/dia y manifest.json en DIR")
+    parser.add_argument('--shards-por', choices=SHARD_LAYOUTS, default='channel',
+                        help="Layout de los fragmentos (default: channel)")
+    parser.add_argument('--derivados', nargs='?', const='todos', default=None, metavar='NOMBRES',
+                        help="Feeds por contenido (p.ej. deportes,peliculas; default: todos), escritos como "
+                             "<entrada>_<nombre>.xml en la misma pasada que archivo_salida")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="Ademas deja el .snap de cada salida (re-parsea el XML escrito; sin esto "
+                             "load_guide lo genera la primera vez que alguien lo lee)")
+    parser.add_argument('--definiciones', metavar='JSON', default=None,
+                        help="JSON {nombre: {palabras, categorias, campos, canales}} en lugar de DERIVADOS")
+    args = parser.parse_args()
+    if not args.archivo_salida and not args.derivados:
+        parser.error("falta archivo_salida (o --derivados)")
+    if args.derivados and (args.modo or args.workers):
+        parser.error("--modo/--workers no aplican con --derivados (una sola pasada mmap para todas las salidas)")
+    args.modo = args.modo or 'tree'
 
-    archivo_entrada = sys.argv[1]
-    archivo_salida = sys.argv[2]
+    if args.derivados:
+        definiciones = DERIVADOS
+        if args.definiciones:
+            with open(args.definiciones, encoding='utf-8') as f:
+                definiciones = json.load(f)
+        nombres = list(definiciones) if args.derivados == 'todos' else [n.strip() for n in args.derivados.split(',')]
+        desconocidos = [n for n in nombres if n not in definiciones]
+        if desconocidos:
+            parser.error(f"feeds derivados desconocidos: {', '.join(desconocidos)}")
+        rutas = rutas_derivadas(args.archivo_entrada, nombres)
+        salidas = {rutas[n]: FiltroContenido.desde_dict(definiciones[n]) for n in nombres}
+        # Una sola lectura: filtro por canales + todos los derivados
+        conteos = filtrar_derivados(args.archivo_entrada, salidas, canales_mexico, args.archivo_salida)
+        for ruta, total in conteos.items():
+            print(f"{ruta}: {total} programas")
+            if args.snapshot:
+                snapshot_xmltv(ruta)
+    elif args.modo == 'paralelo':
+        filtrar_epg_paralelo(args.archivo_entrada, args.archivo_salida, canales_mexico, workers=args.workers)
+    elif args.modo == 'mmap':
+        filtrar_epg_mmap(args.archivo_entrada, args.archivo_salida, canales_mexico)
+    else:
+        filtrar_epg(args.archivo_entrada, args.archivo_salida, canales_mexico)
 
-    filtrar_epg(archivo_entrada, archivo_salida, canales_mexico)
+    if args.archivo_salida:
+        if args.snapshot:
+            snapshot_xmltv(args.archivo_salida)  # Opt-in: cuesta un parse completo, lo que mmap/paralelo evitan
+        if args.shards:
+            write_shards(args.archivo_salida, args.shards, by=args.shards_por)
@@ -0,0 +1,65 @@
+"""Presupuesto de tiempo global para una corrida de un generador.
+
+RunBudget(600) marca un deadline a 10 minutos. Los pasos lentos piden sus
+timeouts con budget.timeout(base): mientras sobra tiempo reciben base, y a
+medida que el presupuesto se acaba reciben una fraccion de lo que queda, asi
+ningun request puede pasarse del deadline por mucho.
+"""
+import time
+
+MIN_TIMEOUT = 2.0
+
+
+class RunBudget:
+    """Deadline de la corrida (monotonic). seconds=None/0 = sin limite."""
+
+    def __init__(self, seconds=None, reserve=0.0):
+        self.started = time.monotonic()
+        self.seconds = seconds or None
+        # reserve: segundos guardados para escribir el XML al final
+        self.reserve = reserve
+
+    @property
+    def deadline(self):
+        return None if self.seconds is None else self.started + self.seconds - self.reserve
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        if self.seconds is None:
+            return float('inf')
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, base, share=0.5):
+        """Timeout para un paso: base, pero nunca mas que share * lo que queda (minimo MIN_TIMEOUT)."""
+        return max(MIN_TIMEOUT, min(base, self.remaining() * share))
+
+    def sleep(self, seconds):
+        """time.sleep recortado al presupuesto restante."""
+        seconds = min(seconds, self.remaining())
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def __repr__(self):
+        if self.seconds is None:
+            return f"<RunBudget unlimited, elapsed {self.elapsed():.1f}s>"
+        return f"<RunBudget {self.remaining():.1f}s left of {self.seconds}s>"
+
+
+def parse_priorities(spec):
+    """'967:10, 222:5' -> {967: 10, 222: 5}. Canales sin entrada tienen prioridad 0."""
+    priorities = {}
+    for item in (spec or '').split(','):
+        if ':' in item:
+            chan, prio = item.split(':', 1)
+            priorities[int(chan.strip())] = int(prio.strip())
+    return priorities
+
+
+def order_by_priority(channel_ids, priorities):
+    """Mayor prioridad primero; empate = orden original (sort estable)."""
+    return sorted(channel_ids, key=lambda c: -priorities.get(c, 0))
@@ -0,0 +1,54 @@
+"""Formato del log de historial: round-trip, lotes que se pisan, compactacion y logs corruptos."""
+import os
+
+from history_store import HEADER, HistoryStore, decode_batches, encode_batch, resolve
+
+DAY = 86400
+
+
+def prog(start, stop, title, desc=''):
+    return (start, stop, title, '', desc, '', '', '', 'es')
+
+
+def test_encode_decode_round_trip():
+    batch = [prog(1000, 1900, 'Noticias', 'Resumen del día'), prog(1900, 4000, 'Película ñandú'),
+             (4000, 4000, 'Cierre', 'sub', '', 'Cine\x1fDrama', 'xmltv_ns', '0/1/0', '')]
+    data = b'\0' * HEADER.size + encode_batch(batch) + encode_batch([])
+    assert list(decode_batches(data)) == [batch, []]
+
+
+def test_later_batch_overrides_its_range():
+    first = [prog(0, 100, 'A'), prog(100, 200, 'B'), prog(200, 300, 'C')]
+    second = [prog(100, 150, 'B1'), prog(150, 200, 'B2')]
+    assert resolve([first, second]) == [prog(0, 100, 'A'), prog(100, 150, 'B1'), prog(150, 200, 'B2'),
+                                        prog(200, 300, 'C')]
+
+
+def test_compact_drops_rows_outside_window(tmp_path):
+    now = 30 * DAY
+    store = HistoryStore(str(tmp_path), catchup_days=7)
+    old = [prog(now - 10 * DAY, now - 9 * DAY, 'Vieja')]
+    recent = [prog(now - DAY, now - DAY + 3600, 'Reciente'), prog(now, now + 3600, 'Ahora')]
+    assert store.append('MVS.967', old, now)
+    assert store.append('MVS.967', recent, now)
+    store.compact('MVS.967', now)
+    assert store.programmes('MVS.967') == recent
+    with open(store._path('MVS.967'), 'rb') as f:
+        data = f.read()
+    assert len(list(decode_batches(data))) == 1
+    assert HEADER.unpack_from(data)[1] == len(data)
+
+
+def test_corrupt_log_is_set_aside(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    path = store._path('MVS.967')
+    with open(path, 'wb') as f:
+        f.write(b'EPGH')  # Menos de HEADER.size bytes
+    assert store.programmes('MVS.967') == []
+    assert os.path.exists(path + '.corrupt') and not os.path.exists(path)
+
+    assert store.append('MVS.967', [prog(0, 100, 'A')], now=0)
+    with open(path, 'ab') as f:
+        f.write(b'B\x05')  # Lote truncado por un append interrumpido
+    assert store.append('MVS.967', [prog(100, 200, 'B')], now=0)
+    assert store.programmes('MVS.967') == [prog(100, 200, 'B')]
@@ -0,0 +1,147 @@
+"""Canales timeshift (+1, +2...) generados localmente desde su canal base.
+
+Un canal "+2" es la misma programacion del canal base corrida 2 horas. En vez de
+usar la copia que manda el upstream, se declara en TIMESHIFTS (o en un JSON con
+el mismo formato) y se genera en la misma pasada de bytes que copia la guia:
+
+    {"base": "CANAL DE LAS ESTRELLAS.mx", "offset": 7200,
+     "id": "CANAL DE LAS ESTRELLAS +2.mx", "name": "CANAL DE LAS ESTRELLAS +2"}
+
+Cada <programme> del base se re-emite con start/stop corridos (conservando la
+zona horaria) y channel=id; el <channel> se copia con el id y display-name
+nuevos. Los elementos del canal derivado que traiga el upstream se descartan
+sin parsear, pero solo si el base esta en la guia; si no, se conservan.
+
+Solo escribe el XML; los .gz/.xz se generan despues con epg_output.py, una sola
+vez por corrida.
+
+Uso: python timeshift.py guiamix.xml [-o salida.xml] [--config timeshifts.json]
+"""
+from collections import namedtuple
+from xml.sax.saxutils import escape
+import argparse
+import io
+import json
+import logging
+import mmap
+import re
+
+from epg_output import write_if_changed
+from guide_snapshot import snapshot_xmltv
+from procesar_xml import delimitar_tv, escanear_elementos
+from xmltv_utils import shift_xmltv_time
+
+logger = logging.getLogger(__name__)
+
+Timeshift = namedtuple('Timeshift', 'base offset id name')
+
+TIMESHIFTS = [
+    Timeshift('CANAL DE LAS ESTRELLAS.mx', 2 * 3600, 'CANAL DE LAS ESTRELLAS +2.mx', 'CANAL DE LAS ESTRELLAS +2.mx'),
+]
+
+_RE_TIEMPO = re.compile(rb'(\s(?:start|stop)=)(["\'])(.*?)\2')
+_RE_ID = {
+    b'channel': re.compile(rb'(\sid=)(["\'])(.*?)\2', re.DOTALL),
+    b'programme': re.compile(rb'(\schannel=)(["\'])(.*?)\2', re.DOTALL),
+}
+_RE_DISPLAY_NAME = re.compile(rb'(\s*)<display-name\b([^>]*)>.*?</display-name>', re.DOTALL)
+
+
+def load_timeshifts(path):
+    """Lista de Timeshift desde un JSON [{base, offset, id, name}, ...]."""
+    with open(path, encoding='utf-8') as f:
+        return [Timeshift(d['base'], int(d['offset']), d['id'], d.get('name') or d['id']) for d in json.load(f)]
+
+
+def _attr_bytes(value):
+    return escape(value, {'"': '&quot;'}).encode('utf-8')
+
+
+def _shift_channel(element, shift):
+    """<channel> del base con id y display-name del derivado (sin los display-name extra)."""
+    new_id = _attr_bytes(shift.id)
+    element = _RE_ID[b'channel'].sub(lambda m: m.group(1) + m.group(2) + new_id + m.group(2), element, count=1)
+    first = [True]
+
+    def rename(m):
+        if not first[0]:
+            return b''
+        first[0] = False
+        return m.group(1) + b'<display-name' + m.group(2) + b'>' + escape(shift.name).encode('utf-8') + b'</display-name>'
+    return _RE_DISPLAY_NAME.sub(rename, element)
+
+
+def _shift_programme(element, shift):
+    offset, new_id = shift.offset, _attr_bytes(shift.id)
+
+    def retime(m):
+        value = shift_xmltv_time(m.group(3).decode('ascii'), offset).encode('ascii')
+        return m.group(1) + m.group(2) + value + m.group(2)
+    # Solo el tag de apertura: el texto de title/desc queda intacto
+    cut = element.index(b'>') + 1
+    head = _RE_TIEMPO.sub(retime, element[:cut], count=2)
+    head = _RE_ID[b'programme'].sub(lambda m: m.group(1) + m.group(2) + new_id + m.group(2), head, count=1)
+    return head + element[cut:]
+
+
+def apply_timeshifts(input_xml, out, shifts=TIMESHIFTS):
+    """Copia input_xml a out (file-like binario) generando los canales de shifts.
+
+    Retorna {id derivado: programas generados} para los que tenian base.
+    """
+    with open(input_xml, 'rb') as f_in, mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        inicio, fin = delimitar_tv(buf)
+        presentes = {clave for tag, _, _, clave in escanear_elementos(buf, inicio, fin) if tag == b'channel'}
+        por_base = {}
+        for shift in shifts:
+            if _attr_bytes(shift.base) in presentes:
+                por_base.setdefault(_attr_bytes(shift.base), []).append(shift)
+            else:
+                logger.info(f"Timeshift {shift.id}: base {shift.base} not in {input_xml} - keeping upstream copy")
+        derivados = {_attr_bytes(s.id) for lista in por_base.values() for s in lista}
+        generados = {s.id: 0 for lista in por_base.values() for s in lista}
+
+        out.write(buf[:inicio])
+        cola = inicio  # Fin del ultimo elemento: lo que sigue (espacios + </tv>) se copia tal cual
+        pendientes, clave_pendiente = [], None  # Programas corridos del bloque actual del base
+        for tag, a, b, clave in escanear_elementos(buf, inicio, fin):
+            cola = b
+            if pendientes and (tag != b'programme' or clave != clave_pendiente):
+                out.write(b''.join(pendientes))
+                pendientes = []
+            if clave in derivados:
+                continue  # Lo regeneramos desde el base
+            element = buf[a:b]
+            out.write(element)
+            for shift in por_base.get(clave, ()):
+                if tag == b'channel':
+                    out.write(_shift_channel(element, shift))
+                else:
+                    pendientes.append(_shift_programme(element, shift))
+                    clave_pendiente = clave
+                    generados[shift.id] += 1
+        out.write(b''.join(pendientes))
+        out.write(buf[cola:])
+    return generados
+
+
+def timeshift_file(input_xml, output_xml=None, shifts=TIMESHIFTS):
+    """Aplica shifts y reescribe output_xml (default: el mismo archivo, sin .gz/.xz) solo si cambio."""
+    out = io.BytesIO()
+    generados = apply_timeshifts(input_xml, out, shifts)
+    for shift_id, total in generados.items():
+        logger.info(f"Timeshift {shift_id}: {total} programmes generated")
+    output_xml = output_xml or input_xml
+    if write_if_changed(output_xml, out.getvalue(), formats=()):
+        snapshot_xmltv(output_xml)
+    return generados
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Genera canales timeshift desde su canal base.")
+    parser.add_argument('archivo_entrada')
+    parser.add_argument('-o', '--salida', default=None, help="Default: reescribe archivo_entrada")
+    parser.add_argument('--config', default=None, help="JSON [{base, offset, id, name}] en lugar de TIMESHIFTS")
+    args = parser.parse_args()
+    timeshift_file(args.archivo_entrada, args.salida, load_timeshifts(args.config) if args.config else TIMESHIFTS)
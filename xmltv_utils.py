@@ -0,0 +1,31 @@
+"""Helpers compartidos para leer y escribir tiempos XMLTV."""
+from datetime import datetime, timezone
+import calendar
+
+
+def parse_xmltv_time(value):
+    """Convierte 'YYYYMMDDHHMMSS +HHMM' / '...Z' / sin zona (UTC) a epoch en segundos."""
+    value = value.strip()
+    digits = value[:14].ljust(14, '0')
+    epoch = calendar.timegm((int(digits[0:4]), int(digits[4:6]), int(digits[6:8]),
+                             int(digits[8:10]), int(digits[10:12]), int(digits[12:14])))
+    tz = value[14:].strip()
+    if tz and tz != 'Z':
+        sign = -1 if tz[0] == '-' else 1
+        tz = tz.lstrip('+-')
+        epoch -= sign * (int(tz[0:2]) * 3600 + int(tz[2:4] or 0) * 60)
+    return epoch
+
+
+def format_xmltv_time(epoch):
+    """Epoch en segundos a 'YYYYMMDDHHMMSS +0000'."""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y%m%d%H%M%S") + " +0000"
+
+
+def shift_xmltv_time(value, seconds):
+    """Corre un tiempo XMLTV seconds segundos conservando su zona ('... +0000', 'Z' o sin zona)."""
+    stripped = value.strip()
+    digits, tz = stripped[:14].ljust(14, '0'), stripped[14:]
+    local = datetime.strptime(digits, "%Y%m%d%H%M%S")
+    return datetime.fromtimestamp(calendar.timegm(local.timetuple()) + seconds,
+                                  tz=timezone.utc).strftime("%Y%m%d%H%M%S") + tz